@@ -0,0 +1,570 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Benchmarks for the conversion pipeline
+
+Uses the test images in the repository root, and inputs synthesized from them
+at several resolutions, layouts and data formats. Results are stored per tool
+version, so a later run can be compared against them to catch regressions.
+
+by David Maus - www.david-maus.de
+
+Written by David Maus / info@david-maus.de, 2018
+"""
+# fmt: off
+
+# -------------------------------------------------------------------------------------
+# Imports
+# -------------------------------------------------------------------------------------
+
+import sys; sys.dont_write_bytecode = True
+import os
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+import OpenImageIO as oiio
+from OpenImageIO import ImageBuf, ImageBufAlgo, ROI
+from pathlib import Path
+import folder
+import blur
+import color
+import processHDR
+
+# -------------------------------------------------------------------------------------
+# Global
+# -------------------------------------------------------------------------------------
+
+testImages      = ["testImageEXR.exr", "testImageHDR.hdr"]
+textureImage    = "testImageJPG.jpg"
+seamColumns     = 64
+
+# 16384 and 32768 need several GB of memory, pass them with --sizes
+synthWidths     = [2048, 4096, 8192]
+synthLayouts    = ["scanline", "tiled"]
+synthFormats    = {"half": oiio.HALF, "float": oiio.FLOAT}
+
+compressionCodecs = ["none", "zip", "piz", "pxr24", "dwaa:45", "dwab:45"]
+
+synthTileSize   = 64
+# random texture lookups through a cold, small TextureSystem cache
+lookupCount     = 20000
+lookupCacheMB   = 32
+lookupSeed      = 2018
+# filter widths of the lookups, 0 hits the finest MIP level
+lookupWidths    = [0.0, 1.0 / 2048, 1.0 / 256, 1.0 / 32]
+
+inputFolder     = folder.rootDir("_benchmark/inputs")
+resultsFolder   = folder.rootDir("_benchmark/results")
+regressionLimit = 1.10
+# file sizes (the "/MB" results) don't jitter like timings
+sizeLimit       = 1.01
+
+# -------------------------------------------------------------------------------------
+# Functions
+# -------------------------------------------------------------------------------------
+# fmt: on
+
+
+def timeIt(func, args, repeat):
+    """Best wall time of `repeat` runs and the result of the last one."""
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        result = func(*args)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def maxError(bufA, bufB, roi=ROI.All):
+    return ImageBufAlgo.compare(bufA, bufB, 1.0e-3, 1.0e-4, roi).maxerror
+
+
+def loadBlurInput(image, width=None):
+    """Test image resized to the width the pipeline blurs at."""
+    width = width or processHDR.hdrBlurWidth
+    srcBuffer = ImageBuf(str(folder.rootDir(image)))
+    spec = srcBuffer.spec()
+    newHeight = processHDR.calculateResizeHeight(spec.width, spec.height, width)
+    return processHDR.resizeHDR(srcBuffer, width, newHeight)
+
+
+def synthName(image, width, layout, formatName):
+    return "%s-%d-%s-%s.exr" % (Path(image).stem, width, layout, formatName)
+
+
+def synthInput(image, width, layout, formatName):
+    """Test image resized to width, written as scanline or tiled half/float
+    .exr. Inputs are kept in inputFolder and only made once."""
+    outFile = Path(inputFolder, synthName(image, width, layout, formatName))
+    if outFile.exists():
+        return outFile
+
+    if not Path(inputFolder).exists():
+        Path(inputFolder).mkdir(parents=True)
+
+    srcBuffer = ImageBuf(str(folder.rootDir(image)))
+    spec = srcBuffer.spec()
+    height = processHDR.calculateResizeHeight(spec.width, spec.height, width)
+    resized = processHDR.resizeHDR(srcBuffer, width, height)
+
+    resized.set_write_format(synthFormats[formatName])
+    if layout == "tiled":
+        resized.set_write_tiles(synthTileSize, synthTileSize)
+    else:
+        resized.set_write_tiles(0, 0)
+
+    if not resized.write(str(outFile)):
+        raise IOError("Could not write %s: %s" % (outFile, resized.geterror()))
+    return outFile
+
+
+def synthInputs(widths):
+    """(name, path) of every width/layout/format combination of the first
+    test image."""
+    inputs = []
+    for width in widths:
+        for layout in synthLayouts:
+            for formatName in sorted(synthFormats):
+                inputFile = synthInput(testImages[0], width, layout, formatName)
+                inputs.append((Path(inputFile).stem, inputFile))
+    return inputs
+
+
+def readInput(inputFile):
+    srcBuffer = ImageBuf(str(inputFile))
+    srcBuffer.read(0, 0, True)
+    return srcBuffer
+
+
+def benchFunctions(repeat, widths):
+    """Every public pipeline step on every synthesized input."""
+    results = {}
+    workDir = tempfile.mkdtemp(prefix="txBench")
+
+    try:
+        for name, inputFile in synthInputs(widths):
+            srcBuffer = readInput(inputFile)
+            spec = srcBuffer.spec()
+            halfHeight = processHDR.calculateResizeHeight(
+                spec.width, spec.height, spec.width // 2
+            )
+            steps = [
+                ("read", readInput, [inputFile]),
+                (
+                    "resizeHDR",
+                    processHDR.resizeHDR,
+                    [srcBuffer, spec.width // 2, halfHeight],
+                ),
+                ("blurImage", processHDR.blurImage, [srcBuffer]),
+                (
+                    "convertColor",
+                    processHDR.convertColor,
+                    [srcBuffer, "linear", "sRGB"],
+                ),
+                (
+                    "writeEXR",
+                    processHDR.writeEXR,
+                    [srcBuffer, os.path.join(workDir, "out.exr")],
+                ),
+                (
+                    "writeTexture",
+                    processHDR.writeTexture,
+                    [srcBuffer, os.path.join(workDir, "out.tx")],
+                ),
+                (
+                    "writeJPG",
+                    processHDR.writeJPG,
+                    [srcBuffer, os.path.join(workDir, "out.jpg")],
+                ),
+            ]
+
+            print("\n%s (%dx%d)" % (name, spec.width, spec.height))
+            for stepName, func, args in steps:
+                stepTime, result = timeIt(func, args, repeat)
+                results["%s/%s" % (stepName, name)] = stepTime
+                print("%-14s %8.3fs" % (stepName, stepTime))
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    return results
+
+
+def benchCompression(repeat):
+    """Write time and size of the tiled .exr for every codec and data format,
+    and of the .tx for the jpg texture with source and auto format."""
+    results = {}
+    workDir = tempfile.mkdtemp(prefix="txBench")
+    settings = (processHDR.exrCompression, processHDR.dataFormat)
+
+    try:
+        cases = [
+            (
+                image,
+                loadBlurInput(image),
+                codec,
+                dataFormat,
+                processHDR.writeEXR,
+                ".exr",
+            )
+            for image in testImages
+            for codec in compressionCodecs
+            for dataFormat in ["half", "float"]
+        ]
+        texture = ImageBuf(str(folder.rootDir(textureImage)))
+        cases += [
+            (textureImage, texture, "zip", dataFormat, processHDR.writeTexture, ".tx")
+            for dataFormat in ["source", "auto"]
+        ]
+
+        print("%-18s %-8s %-6s %9s %10s" % ("image", "codec", "format", "time", "size"))
+        for image, srcBuffer, codec, dataFormat, writeFunc, extension in cases:
+            processHDR.exrCompression = codec
+            processHDR.dataFormat = dataFormat
+            outFile = os.path.join(workDir, "out" + extension)
+
+            writeTime, result = timeIt(writeFunc, [srcBuffer, outFile], repeat)
+            sizeMB = os.path.getsize(outFile) / 1024.0 / 1024.0
+
+            key = "compression/%s/%s/%s" % (codec, dataFormat, image)
+            results[key + "/time"] = writeTime
+            results[key + "/MB"] = sizeMB
+            print(
+                "%-18s %-8s %-6s %8.3fs %8.1fMB"
+                % (image, codec, dataFormat, writeTime, sizeMB)
+            )
+    finally:
+        processHDR.exrCompression, processHDR.dataFormat = settings
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    return results
+
+
+def timeLookups(textureFile, nchannels):
+    """Seconds for lookupCount random lookups on a fresh private TextureSystem,
+    so every run starts with a cold cache."""
+    ts = oiio.TextureSystem(False)
+    ts.attribute("max_memory_MB", float(lookupCacheMB))
+    opt = oiio.TextureOpt()
+    rng = random.Random(lookupSeed)
+
+    start = time.time()
+    for i in range(lookupCount):
+        width = rng.choice(lookupWidths)
+        ts.texture(
+            textureFile, opt, rng.random(), rng.random(), width, 0, 0, width, nchannels
+        )
+    elapsed = time.time() - start
+
+    oiio.TextureSystem.destroy(ts)
+    return elapsed
+
+
+def benchTiles(repeat):
+    """Random access read cost through a TextureSystem for every tile size of
+    the tiled environment (at hdrWidth) and of the .tx texture."""
+    if not hasattr(oiio, "TextureSystem"):
+        print("tiles skipped, this OpenImageIO has no TextureSystem bindings")
+        return {}
+
+    results = {}
+    workDir = tempfile.mkdtemp(prefix="txBench")
+    settings = (processHDR.envTileSize, processHDR.textureTileSize)
+
+    try:
+        cases = [
+            (
+                "env",
+                loadBlurInput(testImages[0], processHDR.hdrWidth),
+                processHDR.writeEXR,
+                ".exr",
+            ),
+            (
+                "texture",
+                ImageBuf(str(folder.rootDir(textureImage))),
+                processHDR.writeTexture,
+                ".tx",
+            ),
+        ]
+
+        print("%-8s %-5s %10s %10s" % ("output", "tile", "lookups", "size"))
+        for kind, srcBuffer, writeFunc, extension in cases:
+            for size in ["auto"] + processHDR.tileSizeChoices:
+                processHDR.envTileSize = processHDR.textureTileSize = size
+                outFile = os.path.join(workDir, "%s-%s%s" % (kind, size, extension))
+                writeFunc(srcBuffer, outFile)
+
+                lookupTime = min(
+                    timeLookups(outFile, srcBuffer.spec().nchannels)
+                    for i in range(repeat)
+                )
+                sizeMB = os.path.getsize(outFile) / 1024.0 / 1024.0
+
+                key = "tiles/%s/%s" % (kind, size)
+                results[key + "/lookups"] = lookupTime
+                results[key + "/MB"] = sizeMB
+                print("%-8s %-5s %9.3fs %8.1fMB" % (kind, size, lookupTime, sizeMB))
+    finally:
+        processHDR.envTileSize, processHDR.textureTileSize = settings
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    return results
+
+
+def setWorkspace(rootFolder):
+    """Point the end-to-end flows of processHDR at a scratch folder."""
+    processHDR.rootFolder = Path(rootFolder)
+    processHDR.adaptFolder = Path(rootFolder, "_ADAPTLOOKDEV_")
+    processHDR.hdrFolder = Path(rootFolder, "_ADAPTLOOKDEV_/lighting/hdr")
+    processHDR.hdrPrevFolder = Path(processHDR.hdrFolder, "previews")
+    processHDR.hdrBlurFolder = Path(processHDR.hdrFolder, "blurred")
+    processHDR.hdrFolder.mkdir(parents=True)
+
+
+def benchEndToEnd(repeat, widths):
+    """processHDRs and processTextures in headless mode on fresh scratch
+    folders, with one scanline half input per width (the worst case)."""
+    results = {}
+    processHDR.batchMode = True
+    processHDR.width = 80
+    processHDR.configureCache()
+
+    for width in widths:
+        hdrFile = synthInput(testImages[0], width, "scanline", "half")
+        textureFile = synthInput(textureImage, width, "scanline", "half")
+
+        for flow, target, source in [
+            ("processHDRs", processHDR.processHDRs, hdrFile),
+            ("processTextures", lambda: processHDR.processTextures([]), textureFile),
+        ]:
+            best = None
+            for i in range(repeat):
+                workDir = tempfile.mkdtemp(prefix="txBench")
+                try:
+                    setWorkspace(workDir)
+                    shutil.copy(str(source), str(processHDR.hdrFolder))
+                    start = time.time()
+                    failed = target()
+                    elapsed = time.time() - start
+                finally:
+                    shutil.rmtree(workDir, ignore_errors=True)
+
+                if failed:
+                    raise RuntimeError("%s failed on %s" % (flow, source))
+                best = elapsed if best is None else min(best, elapsed)
+
+            results["%s/%d" % (flow, width)] = best
+            print("%-16s %6d %8.3fs" % (flow, width, best))
+
+    return results
+
+
+def saveResults(results, resultsFile):
+    if not Path(resultsFile).parent.exists():
+        Path(resultsFile).parent.mkdir(parents=True)
+
+    with open(str(resultsFile), "w") as f:
+        json.dump(
+            {
+                "tool": processHDR.__version__,
+                "python": platform.python_version(),
+                "oiio": oiio.VERSION_STRING,
+                "platform": platform.platform(),
+                "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "results": results,
+            },
+            f,
+            indent=1,
+            sort_keys=True,
+        )
+
+
+def compareResults(results, baselineFile):
+    """Print the change against a stored run, returns the regressed keys.
+
+    Timings regress above regressionLimit, the "/MB" file sizes above
+    sizeLimit.
+    """
+    with open(str(baselineFile), "r") as f:
+        baseline = json.load(f)
+
+    print("\nAgainst %s (tool %s)" % (baselineFile, baseline["tool"]))
+    regressions = []
+
+    for key in sorted(results):
+        if key not in baseline["results"]:
+            continue
+        isSize = key.endswith("/MB")
+        ratio = results[key] / max(baseline["results"][key], 1.0e-9)
+        flag = ""
+        if ratio > (sizeLimit if isSize else regressionLimit):
+            flag = "LARGER" if isSize else "REGRESSION"
+            regressions.append(key)
+        unit = "MB" if isSize else "s"
+        print(
+            "%-40s %8.3f%-2s -> %8.3f%-2s %6.2fx %s"
+            % (key, baseline["results"][key], unit, results[key], unit, ratio, flag)
+        )
+
+    return regressions
+
+
+def benchBlur(repeat):
+    """Every blur engine against the full 2D convolve.
+
+    The interior error leaves out the seam columns, where the other engines
+    wrap around and convolve does not.
+    """
+    args = [
+        processHDR.blurFilter,
+        processHDR.blurAmountX,
+        processHDR.blurAmountY,
+    ]
+
+    results = {}
+
+    for image in testImages:
+        srcBuffer = loadBlurInput(image)
+        spec = srcBuffer.spec()
+        interior = ROI(seamColumns, spec.width - seamColumns, 0, spec.height)
+
+        refTime, refBuffer = timeIt(blur.blurConvolve, [srcBuffer] + args, repeat)
+        results["blur/convolve/%s" % image] = refTime
+
+        print("\n%s (%dx%d)" % (image, spec.width, spec.height))
+        print(
+            "%-10s %9s %8s %12s %12s"
+            % ("engine", "time", "speedup", "max err", "interior")
+        )
+        print("%-10s %8.3fs %7.1fx %12s %12s" % ("convolve", refTime, 1.0, "-", "-"))
+
+        for engine in ["separable", "fft", "pyramid"]:
+            if engine == "fft" and not blur.hasNumpy():
+                print("%-10s skipped, numpy not installed" % engine)
+                continue
+
+            engineTime, engineBuffer = timeIt(
+                blur.blur, [srcBuffer, engine] + args, repeat
+            )
+            results["blur/%s/%s" % (engine, image)] = engineTime
+            print(
+                "%-10s %8.3fs %7.1fx %12.6f %12.6f"
+                % (
+                    engine,
+                    engineTime,
+                    refTime / engineTime,
+                    maxError(engineBuffer, refBuffer),
+                    maxError(engineBuffer, refBuffer, interior),
+                )
+            )
+
+    return results
+
+
+def benchColor(repeat):
+    """Preview color transform per view: colorconvert against the 1D LUT, and
+    what baking the LUT costs once per process."""
+    results = {}
+
+    for image in testImages:
+        srcBuffer = loadBlurInput(image)
+        spec = srcBuffer.spec()
+
+        print("\n%s (%dx%d)" % (image, spec.width, spec.height))
+        print(
+            "%-10s %9s %9s %8s %9s %12s"
+            % ("view", "direct", "lut", "speedup", "bake", "max err")
+        )
+
+        for view in color.views:
+            direct = color.Transform("linear", "sRGB", view)
+            directTime, directBuffer = timeIt(direct.apply, [srcBuffer], repeat)
+            results["color/direct/%s/%s" % (view, image)] = directTime
+
+            if not color.hasNumpy():
+                print(
+                    "%-10s %8.3fs lut skipped, numpy not installed" % (view, directTime)
+                )
+                continue
+
+            bakeTime, lut = timeIt(
+                color.Transform, ["linear", "sRGB", view, 0.0, True], 1
+            )
+            if lut.lut is None:
+                print(
+                    "%-10s %8.3fs lut not usable for this transform"
+                    % (view, directTime)
+                )
+                continue
+
+            lutTime, lutBuffer = timeIt(lut.apply, [srcBuffer], repeat)
+            results["color/lut/%s/%s" % (view, image)] = lutTime
+            print(
+                "%-10s %8.3fs %8.3fs %7.1fx %8.3fs %12.6f"
+                % (
+                    view,
+                    directTime,
+                    lutTime,
+                    directTime / lutTime,
+                    bakeTime,
+                    maxError(lutBuffer, directBuffer),
+                )
+            )
+
+    return results
+
+
+def main():
+    """Returns 1 if a regression against --compare was found."""
+    parser = argparse.ArgumentParser(description="Texture Converter benchmarks")
+    parser.add_argument(
+        "suites",
+        nargs="+",
+        choices=["blur", "functions", "e2e", "compression", "tiles", "color"],
+        help="Benchmarks to run",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs per measurement (best is kept)"
+    )
+    parser.add_argument(
+        "--sizes",
+        default=",".join(str(w) for w in synthWidths),
+        help="Widths of the synthesized inputs, e.g. 2048,4096,8192,16384,32768",
+    )
+    parser.add_argument(
+        "--save",
+        default=str(Path(resultsFolder, processHDR.__version__ + ".json")),
+        help="Where to store the results (default: %(default)s)",
+    )
+    parser.add_argument("--compare", help="Results of an earlier run to compare with")
+    results = parser.parse_args()
+
+    widths = [int(w) for w in results.sizes.split(",")]
+    timings = {}
+
+    if "blur" in results.suites:
+        timings.update(benchBlur(results.repeat))
+    if "functions" in results.suites:
+        timings.update(benchFunctions(results.repeat, widths))
+    if "e2e" in results.suites:
+        timings.update(benchEndToEnd(results.repeat, widths))
+    if "compression" in results.suites:
+        timings.update(benchCompression(results.repeat))
+    if "tiles" in results.suites:
+        timings.update(benchTiles(results.repeat))
+    if "color" in results.suites:
+        timings.update(benchColor(results.repeat))
+
+    saveResults(timings, results.save)
+
+    if results.compare:
+        return 1 if compareResults(timings, results.compare) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
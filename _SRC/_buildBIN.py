@@ -17,8 +17,10 @@ Written by David Maus / info@david-maus.de, 2018
 
 import sys; sys.dont_write_bytecode = True
 import os
+import time
 import subprocess
 import shutil
+import argparse
 
 # -------------------------------------------------------------------------------------
 # Global
@@ -28,34 +30,47 @@ upxWIN      = "_thirdparty/upx394w"
 upxLNX      = "_thirdparty/upx-3.94-amd64_linux"
 upxOSX      = "_thirdparty/upx-3.94-amd64_linux"
 
+startupRuns = 10
+
+# release: single compressed file for distribution
+# farm:    one-dir build without UPX, nothing to unpack on every launch
+profiles    = {
+    "release": dict(
+        oneFile=1, upxWin=0, upxLnx=1, upxOsx=1, upxAfterWin=1, upxAfterLnx=1, upxAfterOsx=1
+    ),
+    "farm": dict(
+        oneFile=0, upxWin=0, upxLnx=0, upxOsx=0, upxAfterWin=0, upxAfterLnx=0, upxAfterOsx=0
+    ),
+}
+
 # -------------------------------------------------------------------------------------
 # Building
 # -------------------------------------------------------------------------------------
 
 def main():
 
-    build(
+    parser = argparse.ArgumentParser(description="PyInstaller Builder")
+    parser.add_argument("--profile", choices=sorted(profiles), default="release")
+    results = parser.parse_args()
+
+    binary = build(
         source="processHDR.py",
         name="_txConverter",
         binDir="../",
-        oneFile=1,
         icon="ui/main.ico",
         uiDir="ui",
         add=[["./pyfiglet", "./pyfiglet"]],
         hiddenImport=["pyfiglet.fonts"],
         buildRES=0,
-        upxWin=0,
-        upxLnx=1,
-        upxOsx=1,
-        upxAfterWin=1,
-        upxAfterLnx=1,
-        upxAfterOsx=1,
         console=1,
         confirm=0,
         deleteSPEC=1,
-        deleteTMP=1
+        deleteTMP=1,
+        **profiles[results.profile]
     )
 
+    benchmarkStartup(binary, startupRuns)
+
 
 # -------------------------------------------------------------------------------------
 # Main
@@ -214,6 +229,32 @@ def build(
         p = subprocess.Popen(upxCommand, shell=True)
         p.wait()
 
+    binary = os.path.join(distPath, name, name) if not oneFile else distPath + name
+    if osPref == "WIN":
+        binary += ".exe"
+
+    return binary
+
+
+def benchmarkStartup(binary, runs):
+    """Launch the built binary `runs` times with --version and report the times."""
+
+    if not os.path.isfile(binary):
+        print("Error: %s not found, no startup benchmark" % binary)
+        return
+
+    times = []
+    with open(os.devnull, "w") as devnull:
+        for i in range(runs):
+            start = time.time()
+            subprocess.call([binary, "--version"], stdout=devnull, stderr=devnull)
+            times.append(time.time() - start)
+
+    print(
+        "Startup %s: min %.3fs, mean %.3fs over %d runs"
+        % (binary, min(times), sum(times) / len(times), runs)
+    )
+
 
 if __name__ == "__main__":
 
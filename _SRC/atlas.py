@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Contact sheet of all previews with a JSON index of UV rects
+
+by David Maus - www.david-maus.de
+
+Written by David Maus / info@david-maus.de, 2018
+"""
+# fmt: off
+
+# -------------------------------------------------------------------------------------
+# Imports
+# -------------------------------------------------------------------------------------
+
+import sys; sys.dont_write_bytecode = True
+import os
+import json
+import OpenImageIO as oiio
+from OpenImageIO import ImageBuf, ImageSpec, ImageBufAlgo, ROI
+from pathlib import Path
+import imagecache
+import journal
+
+# -------------------------------------------------------------------------------------
+# Global vars
+# -------------------------------------------------------------------------------------
+
+atlasVersion        = 1
+atlasColumns        = 8
+atlasChannels       = 3
+
+# -------------------------------------------------------------------------------------
+# Functions
+# -------------------------------------------------------------------------------------
+# fmt: on
+
+
+def fingerprint(path):
+    stat = os.stat(str(path))
+    return [stat.st_size, stat.st_mtime]
+
+
+def loadIndex(indexFile):
+    try:
+        with open(str(indexFile), "r") as f:
+            index = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    return index if index.get("version") == atlasVersion else None
+
+
+def assignSlots(names, entries):
+    """Slot of every name: names keep their slot, new ones fill the gaps left
+    by removed names first, so one changed hdr only touches its own cell."""
+    slots = dict((name, entries[name]["slot"]) for name in names if name in entries)
+    used = set(slots.values())
+    free = (slot for slot in range(len(names)) if slot not in used)
+    for name in sorted(names):
+        if name not in slots:
+            slots[name] = next(free)
+    return slots
+
+
+def blankAtlas(width, height):
+    atlasBuffer = ImageBuf(ImageSpec(width, height, atlasChannels, oiio.UINT8))
+    ImageBufAlgo.zero(atlasBuffer)
+    return atlasBuffer
+
+
+def loadAtlas(atlasFile, width, height):
+    """The previous atlas, grown to height; None if it can't be reused."""
+    if not Path(atlasFile).exists():
+        return None
+
+    oldBuffer = imagecache.openImage(atlasFile)
+    ok = oldBuffer.read(0, 0, True)
+    imagecache.release(atlasFile)
+    if not ok or oldBuffer.spec().width != width:
+        return None
+    if oldBuffer.spec().height == height:
+        return oldBuffer
+
+    atlasBuffer = blankAtlas(width, height)
+    ImageBufAlgo.paste(atlasBuffer, 0, 0, 0, 0, oldBuffer)
+    return atlasBuffer
+
+
+def update(previewFiles, atlasFile, indexFile, columns=atlasColumns):
+    """Pack previewFiles into atlasFile and write indexFile with the pixel and
+    UV rect of each, keyed by file name without extension.
+
+    Only new or changed previews are decoded and pasted into the previous
+    atlas, so atlasFile has to be lossless (like .png): a lossy one would lose
+    quality in the untouched cells on every update. It is rebuilt completely
+    when the cell size or column count changed. Returns the number of pasted
+    previews.
+    """
+    previews = dict((Path(path).stem, path) for path in previewFiles)
+    sizes = {}
+    for name, path in previews.items():
+        spec = imagecache.openImage(path).spec()
+        sizes[name] = (spec.width, spec.height)
+
+    index = loadIndex(indexFile)
+    cellWidth = max([w for w, h in sizes.values()] or [1])
+    cellHeight = max([h for w, h in sizes.values()] or [1])
+
+    layout = [cellWidth, cellHeight, columns]
+    if index is None or index["layout"] != layout:
+        index = {"entries": {}}
+
+    entries = index["entries"]
+    slots = assignSlots(list(previews), entries)
+    rows = max(1, (max(list(slots.values()) or [0]) // columns) + 1)
+    width, height = cellWidth * columns, cellHeight * rows
+
+    changed = [
+        name
+        for name in previews
+        if name not in entries
+        or entries[name]["slot"] != slots[name]
+        or entries[name]["fingerprint"] != fingerprint(previews[name])
+    ]
+    removed = [name for name in entries if name not in previews]
+
+    if len(changed) == 0 and len(removed) == 0 and Path(atlasFile).exists():
+        imagecache.release(*previews.values())
+        return 0
+
+    atlasBuffer = None
+    if len(entries) != 0:
+        atlasBuffer = loadAtlas(atlasFile, width, height)
+    if atlasBuffer is None:
+        atlasBuffer = blankAtlas(width, height)
+        changed = list(previews)
+
+    for name in removed:
+        slot = entries.pop(name)["slot"]
+        x, y = (slot % columns) * cellWidth, (slot // columns) * cellHeight
+        ImageBufAlgo.fill(
+            atlasBuffer,
+            [0.0] * atlasChannels,
+            ROI(x, x + cellWidth, y, y + cellHeight),
+        )
+
+    for name in changed:
+        slot = slots[name]
+        x, y = (slot % columns) * cellWidth, (slot // columns) * cellHeight
+
+        previewBuffer = imagecache.openImage(previews[name])
+        ImageBufAlgo.paste(atlasBuffer, x, y, 0, 0, previewBuffer)
+
+        entries[name] = {
+            "slot": slot,
+            "rect": [x, y, sizes[name][0], sizes[name][1]],
+            "fingerprint": fingerprint(previews[name]),
+        }
+
+    imagecache.release(*previews.values())
+
+    # UVs depend on the atlas height, so they are refreshed for every entry
+    for entry in entries.values():
+        x, y, w, h = entry["rect"]
+        entry["uv"] = [
+            float(x) / width,
+            float(y) / height,
+            float(x + w) / width,
+            float(y + h) / height,
+        ]
+
+    with journal.atomicOutput(atlasFile) as partialFile:
+        if not atlasBuffer.write(partialFile):
+            raise IOError(atlasBuffer.geterror())
+
+    tmpFile = str(indexFile) + ".tmp"
+    with open(tmpFile, "w") as f:
+        json.dump(
+            {
+                "version": atlasVersion,
+                "image": Path(atlasFile).name,
+                "width": width,
+                "height": height,
+                "layout": layout,
+                "entries": entries,
+            },
+            f,
+            indent=1,
+            sort_keys=True,
+        )
+    journal.replaceFile(tmpFile, indexFile)
+
+    return len(changed)
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Blur engines for the blurred environment maps
+
+by David Maus - www.david-maus.de
+
+Written by David Maus / info@david-maus.de, 2018
+"""
+# fmt: off
+
+# -------------------------------------------------------------------------------------
+# Imports
+# -------------------------------------------------------------------------------------
+
+import sys; sys.dont_write_bytecode = True
+import OpenImageIO as oiio
+from OpenImageIO import ImageBuf, ImageSpec, ImageBufAlgo, ROI
+import progress
+
+# -------------------------------------------------------------------------------------
+# Global vars
+# -------------------------------------------------------------------------------------
+
+engines             = ["convolve", "separable", "fft", "pyramid", "auto"]
+
+pyramidFactor       = 4
+pyramidFilter       = "triangle"
+fftMinKernelArea    = 400
+
+np                  = None
+
+# threads per ImageBufAlgo call, 0 uses the OIIO "threads" attribute
+nthreads            = 0
+
+# -------------------------------------------------------------------------------------
+# Functions
+# -------------------------------------------------------------------------------------
+# fmt: on
+
+
+def hasNumpy():
+    """Import numpy on first use, it is slow to import and only the fft engine
+    needs it."""
+    global np
+    if np is None:
+        try:
+            import numpy as np
+        except ImportError:
+            return False
+    return True
+
+
+def makeKernel(filterName, width, height):
+    K = ImageBuf()
+    ImageBufAlgo.make_kernel(K, filterName, width, height)
+    return K
+
+
+def convolveStrips(srcBuffer, K, rowPixels):
+    """convolve in scanline strips, reporting rowPixels per processed row."""
+    spec = srcBuffer.spec()
+    Dst = ImageBuf(ImageSpec(spec.width, spec.height, spec.nchannels, spec.format))
+
+    for roi in progress.strips(spec):
+        ImageBufAlgo.convolve(Dst, srcBuffer, K, roi=roi, nthreads=nthreads)
+        progress.advance(roi.height * rowPixels)
+
+    return Dst
+
+
+def wrapPad(srcBuffer, pad):
+    """Copy of srcBuffer with `pad` columns from the opposite side added left
+    and right, so a horizontal filter wraps around the latlong seam."""
+    spec = srcBuffer.spec()
+    pad = min(pad, spec.width)
+
+    padded = ImageBuf(
+        ImageSpec(spec.width + 2 * pad, spec.height, spec.nchannels, spec.format)
+    )
+    ImageBufAlgo.paste(padded, pad, 0, 0, 0, srcBuffer)
+    ImageBufAlgo.paste(
+        padded, 0, 0, 0, 0, srcBuffer, ROI(spec.width - pad, spec.width, 0, spec.height)
+    )
+    ImageBufAlgo.paste(
+        padded, spec.width + pad, 0, 0, 0, srcBuffer, ROI(0, pad, 0, spec.height)
+    )
+    return padded, pad
+
+
+def unPad(padded, pad, width):
+    Dst = ImageBuf()
+    ImageBufAlgo.cut(Dst, padded, ROI(pad, pad + width, 0, padded.spec().height))
+    return Dst
+
+
+def blurConvolve(srcBuffer, filterName, amountX, amountY):
+    """Full 2D convolution, the reference everything else is measured against."""
+    K = makeKernel(filterName, amountX, amountY)
+    return convolveStrips(srcBuffer, K, srcBuffer.spec().width)
+
+
+def blurSeparable(srcBuffer, filterName, amountX, amountY, report=True):
+    """Horizontal then vertical 1D pass, exact for separable filters."""
+    width = srcBuffer.spec().width
+    rowPixels = width if report else 0
+    padded, pad = wrapPad(srcBuffer, int(amountX) // 2 + 1)
+
+    K = makeKernel(filterName, amountX, 1)
+    Horizontal = convolveStrips(padded, K, rowPixels // 2)
+    K = makeKernel(filterName, 1, amountY)
+    Blurred = convolveStrips(Horizontal, K, rowPixels - rowPixels // 2)
+
+    return unPad(Blurred, pad, width)
+
+
+def blurFFT(srcBuffer, filterName, amountX, amountY):
+    """Convolution as a product in frequency space, worth it for large kernels.
+
+    The FFT is circular, which gives the horizontal latlong wrap for free;
+    rows are edge padded so the poles don't bleed into each other.
+    """
+    spec = srcBuffer.spec()
+    pixels = np.asarray(srcBuffer.get_pixels(oiio.FLOAT), dtype=np.float32)
+    pixels = pixels.reshape(spec.height, spec.width, spec.nchannels)
+
+    K = makeKernel(filterName, amountX, amountY)
+    kh, kw = K.spec().height, K.spec().width
+    kernel = np.asarray(K.get_pixels(oiio.FLOAT), dtype=np.float32).reshape(kh, kw)
+
+    padY = kh // 2 + 1
+    pixels = np.pad(pixels, ((padY, padY), (0, 0), (0, 0)), mode="edge")
+
+    # kernel centered on the origin of an image sized array
+    kernelFull = np.zeros(pixels.shape[:2], dtype=np.float32)
+    kernelFull[:kh, :kw] = kernel
+    kernelFull = np.roll(kernelFull, (-(kh // 2), -(kw // 2)), axis=(0, 1))
+
+    kernelFreq = np.fft.rfft2(kernelFull)
+    result = np.empty_like(pixels)
+    for c in range(spec.nchannels):
+        result[:, :, c] = np.fft.irfft2(
+            np.fft.rfft2(pixels[:, :, c]) * kernelFreq, s=pixels.shape[:2]
+        )
+        progress.advance(spec.width * spec.height // spec.nchannels)
+
+    Blurred = ImageBuf(ImageSpec(spec.width, spec.height, spec.nchannels, spec.format))
+    Blurred.set_pixels(ROI.All, np.ascontiguousarray(result[padY:-padY]))
+    return Blurred
+
+
+def blurPyramid(srcBuffer, filterName, amountX, amountY):
+    """Downsample, blur with a proportionally smaller kernel, upsample.
+
+    An approximation: fine for the very soft blurred environments, not for
+    small kernels.
+    """
+    spec = srcBuffer.spec()
+    smallWidth = max(1, spec.width // pyramidFactor)
+    smallHeight = max(1, spec.height // pyramidFactor)
+
+    Small = ImageBuf(ImageSpec(smallWidth, smallHeight, spec.nchannels, spec.format))
+    ImageBufAlgo.resize(Small, srcBuffer, filtername=pyramidFilter, nthreads=nthreads)
+
+    SmallBlurred = blurSeparable(
+        Small,
+        filterName,
+        max(1.0, float(amountX) / pyramidFactor),
+        max(1.0, float(amountY) / pyramidFactor),
+        report=False,
+    )
+
+    Blurred = ImageBuf(ImageSpec(spec.width, spec.height, spec.nchannels, spec.format))
+    for roi in progress.strips(Blurred.spec()):
+        ImageBufAlgo.resize(
+            Blurred, SmallBlurred, filtername=pyramidFilter, roi=roi, nthreads=nthreads
+        )
+        progress.advance(roi.width * roi.height)
+    return Blurred
+
+
+def pickEngine(amountX, amountY):
+    """fft for large kernels when numpy is around, separable otherwise."""
+    if amountX * amountY >= fftMinKernelArea and hasNumpy():
+        return "fft"
+    return "separable"
+
+
+def blur(srcBuffer, engine, filterName, amountX, amountY):
+    """Blur with the given engine; the result keeps the data format of srcBuffer."""
+    spec = srcBuffer.spec()
+    progress.total(spec.width * spec.height)
+
+    if engine == "auto":
+        engine = pickEngine(amountX, amountY)
+    if engine == "fft" and not hasNumpy():
+        engine = "separable"
+
+    return {
+        "convolve": blurConvolve,
+        "separable": blurSeparable,
+        "fft": blurFFT,
+        "pyramid": blurPyramid,
+    }[engine](srcBuffer, filterName, amountX, amountY)
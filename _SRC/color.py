@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Cached color transforms with exposure and view curves for the previews
+
+by David Maus - www.david-maus.de
+
+Written by David Maus / info@david-maus.de, 2018
+"""
+# fmt: off
+
+# -------------------------------------------------------------------------------------
+# Imports
+# -------------------------------------------------------------------------------------
+
+import sys; sys.dont_write_bytecode = True
+import OpenImageIO as oiio
+from OpenImageIO import ImageBuf, ImageSpec, ImageBufAlgo
+import progress
+import stages
+
+# -------------------------------------------------------------------------------------
+# Global vars
+# -------------------------------------------------------------------------------------
+
+# standard only clips, the others roll highlights off (they need numpy)
+views               = ["standard", "reinhard", "filmic", "aces"]
+
+# 1D LUT nodes, spaced evenly in stops of the linear input
+lutSize             = 4096
+lutMinStops         = -16.0
+lutMaxStops         = 16.0
+# largest difference to colorconvert at which the LUT is still used
+lutTolerance        = 1.0 / 1024
+# colors with unequal channels, a transform that mixes channels fails on them
+testColors          = [
+    [0.18, 0.5, 1.0],
+    [2.0, 0.01, 0.3],
+    [0.0, 0.75, 6.0],
+    [0.04, 0.002, 0.9],
+]
+
+np                  = None
+
+# (fromColor, toColor, view, exposure, lut) -> Transform, per process
+transforms          = {}
+
+# -------------------------------------------------------------------------------------
+# Functions
+# -------------------------------------------------------------------------------------
+# fmt: on
+
+
+def hasNumpy():
+    """numpy, imported on first use; only the view curves and LUTs need it."""
+    global np
+    if np is None and stages.hasNumpy():
+        np = stages.np
+    return np is not None
+
+
+def hable(x):
+    """Uncharted 2 filmic curve."""
+    a, b, c, d, e, f = 0.15, 0.50, 0.10, 0.20, 0.02, 0.30
+    return (x * (a * x + c * b) + d * e) / (x * (a * x + b) + d * f) - e / f
+
+
+def viewCurve(view, x):
+    """Scene linear -> display linear in 0-1 for a numpy array."""
+    if view == "reinhard":
+        return x / (1.0 + x)
+    if view == "filmic":
+        return hable(2.0 * x) / hable(11.2)
+    if view == "aces":
+        # Narkowicz's fit of the ACES RRT + ODT
+        return np.clip(
+            (x * (2.51 * x + 0.03)) / (x * (2.43 * x + 0.59) + 0.14), 0.0, 1.0
+        )
+    return x
+
+
+def colorconvertPixels(pixels, fromColor, toColor):
+    """Run a (rows, columns, 3) array through ImageBufAlgo.colorconvert."""
+    rows, columns, channels = pixels.shape
+    Src = stages.writePixels(ImageSpec(columns, rows, channels, oiio.FLOAT), pixels)
+    Dst = ImageBuf(Src.spec())
+    if not ImageBufAlgo.colorconvert(Dst, Src, fromColor, toColor):
+        raise ValueError(
+            "Can't convert %s to %s: %s" % (fromColor, toColor, Dst.geterror())
+        )
+    return stages.readPixels(Dst)
+
+
+class Transform(object):
+    """fromColor -> toColor conversion with exposure (in stops) and a view curve.
+
+    With lut, exposure, curve and conversion are baked into one 1D LUT that
+    is applied with numpy. This only works if the conversion handles every
+    channel on its own (like the sRGB or Rec709 curves), otherwise, or without
+    numpy, the conversion runs through colorconvert.
+    """
+
+    def __init__(self, fromColor, toColor, view="standard", exposure=0.0, lut=False):
+        self.fromColor = fromColor
+        self.toColor = toColor
+        self.view = view
+        self.gain = 2.0**exposure
+        self.lut = None
+
+        if lut and hasNumpy():
+            self.bake()
+
+    def scene(self, x):
+        """Exposure and view curve in numpy."""
+        return viewCurve(self.view, x * self.gain)
+
+    def bake(self):
+        nodes = 2.0 ** np.linspace(lutMinStops, lutMaxStops, lutSize)
+        ramp = np.repeat(self.scene(nodes).reshape(1, lutSize, 1), 3, axis=2)
+        self.lut = colorconvertPixels(ramp, self.fromColor, self.toColor)[0, :, 0]
+
+        colors = np.asarray(testColors, dtype=np.float32).reshape(1, -1, 3)
+        direct = colorconvertPixels(self.scene(colors), self.fromColor, self.toColor)
+        if np.abs(self.lookup(colors) - direct).max() > lutTolerance:
+            self.lut = None
+
+    def lookup(self, x):
+        """The LUT value of every element of x, interpolated between nodes."""
+        stops = np.log2(np.maximum(x, 2.0**lutMinStops))
+        position = (stops - lutMinStops) * ((lutSize - 1) / (lutMaxStops - lutMinStops))
+        position = np.clip(position, 0, lutSize - 1)
+        index = np.minimum(position.astype(np.int32), lutSize - 2)
+        weight = position - index
+        return self.lut[index] * (1.0 - weight) + self.lut[index + 1] * weight
+
+    def apply(self, srcBuffer, nthreads=0):
+        spec = srcBuffer.spec()
+        progress.total(spec.width * spec.height)
+
+        if self.lut is not None:
+            pixels = stages.readPixels(srcBuffer)
+            pixels[:, :, :3] = self.lookup(pixels[:, :, :3])
+            progress.advance(spec.width * spec.height)
+            return stages.writePixels(spec, pixels)
+
+        if self.view != "standard":
+            if not hasNumpy():
+                raise ImportError("View %s needs numpy" % self.view)
+            pixels = stages.readPixels(srcBuffer)
+            pixels[:, :, :3] = self.scene(pixels[:, :, :3])
+            srcBuffer = stages.writePixels(spec, pixels)
+        elif self.gain != 1.0:
+            Exposed = ImageBuf(spec)
+            ImageBufAlgo.mul(Exposed, srcBuffer, self.gain, nthreads=nthreads)
+            srcBuffer = Exposed
+
+        # one call, so the color processor is looked up once per image
+        Dst = ImageBuf(spec)
+        if not ImageBufAlgo.colorconvert(
+            Dst, srcBuffer, self.fromColor, self.toColor, nthreads=nthreads
+        ):
+            raise ValueError(
+                "Can't convert %s to %s: %s"
+                % (self.fromColor, self.toColor, Dst.geterror())
+            )
+        progress.advance(spec.width * spec.height)
+        return Dst
+
+
+def transform(fromColor, toColor, view="standard", exposure=0.0, lut=False):
+    """The Transform for these settings, built once per process."""
+    key = (fromColor, toColor, view, exposure, lut)
+    if key not in transforms:
+        transforms[key] = Transform(fromColor, toColor, view, exposure, lut)
+    return transforms[key]
+
+
+def convert(
+    srcBuffer, fromColor, toColor, view="standard", exposure=0.0, lut=False, nthreads=0
+):
+    return transform(fromColor, toColor, view, exposure, lut).apply(srcBuffer, nthreads)
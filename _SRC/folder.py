@@ -1,10 +1,27 @@
 import sys
 
 sys.dont_write_bytecode = True
+import os
+import re
+import fnmatch
+import threading
+import Queue
 from pathlib import Path
 
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
 sys.dont_write_bytecode = True
 
+crawlThreads = 8
+# matches buffered ahead of the consumer
+crawlBuffer = 1024
+
 
 def rootDir(folder):
     """Root Path."""
@@ -28,24 +45,171 @@ def fileDir(folder):
         return
 
 
-def getFiles(folder, exFolders, exts, all=True):
-    files = []
-    pattern = "**/*"
+def translatePath(pattern):
+    """fnmatch.translate for patterns on paths: * and ? stay within a folder,
+    ** also crosses folders ("a/**/b.exr" matches a/b.exr and a/x/y/b.exr)."""
+    parts = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2 :]:
+            end = pattern.index("]", i + 2)
+            chars = pattern[i + 1 : end].replace("\\", "\\\\")
+            if chars.startswith("!"):
+                chars = "^" + chars[1:]
+            elif chars.startswith("^"):
+                chars = "\\" + chars
+            parts.append("[" + chars + "]")
+            i = end + 1
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(parts) + r"\Z"
+
+
+def compileRules(patterns):
+    """Glob patterns, or regular expressions when prefixed with "re:".
+
+    Patterns containing a "/" are matched against the path relative to the
+    crawled folder (see translatePath), all others against the file or
+    folder name.
+    """
+    rules = []
+    for pattern in patterns or []:
+        if pattern.startswith("re:"):
+            rules.append(("/" in pattern, re.compile(pattern[3:]).search))
+        elif "/" in pattern:
+            rules.append((True, re.compile(translatePath(pattern)).match))
+        else:
+            rules.append((False, re.compile(fnmatch.translate(pattern)).match))
+    return rules
+
+
+def matchRules(rules, relPath, name):
+    for onPath, match in rules:
+        if match(relPath if onPath else name):
+            return True
+    return False
+
 
-    if all:
-        pattern = "**/*"
+def listDir(directory):
+    """(name, path, isDir) of the entries of directory, without following
+    symlinked folders."""
+    if scandir is not None:
+        for entry in scandir(directory):
+            yield entry.name, entry.path, entry.is_dir(follow_symlinks=False)
     else:
-        pattern = "*"
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            yield name, path, os.path.isdir(path) and not os.path.islink(path)
 
-    for file in Path(folder).glob(pattern):
-        directory = Path(file).parent
-        filename = Path(file).stem
-        extension = Path(file).suffix
 
-        if Path(file).parent.name in exFolders:
-            break
+def crawl(
+    folder, exts=None, exFolders=(), include=None, exclude=None, all=True, threads=None
+):
+    """Yield the matching files below folder as they are found.
+
+    Excluded folders (by name or exclude rule) are pruned before descending,
+    subfolders are listed by a pool of threads. Matches are yielded in no
+    particular order; at most crawlBuffer of them are held ahead of the
+    consumer. Unreadable folders are skipped.
+    """
+    root = str(folder)
+    prefixLength = len(root.rstrip("\\/")) + 1
+    exts = set(ext.lower() for ext in exts) if exts else None
+    exFolders = set(exFolders or ())
+    includeRules = compileRules(include)
+    excludeRules = compileRules(exclude)
+    threads = threads or crawlThreads
+
+    directories = Queue.Queue()
+    found = Queue.Queue(crawlBuffer)
+    stop = threading.Event()
+    lock = threading.Lock()
+    pending = [1]
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                found.put(item, True, 0.1)
+                return
+            except Queue.Full:
+                pass
+
+    def work():
+        while not stop.is_set():
+            directory = directories.get()
+            if directory is None:
+                return
+
+            try:
+                for name, path, isDir in listDir(directory):
+                    relPath = path[prefixLength:].replace("\\", "/")
+
+                    if isDir:
+                        if not all or name in exFolders:
+                            continue
+                        if matchRules(excludeRules, relPath, name):
+                            continue
+                        with lock:
+                            pending[0] += 1
+                        directories.put(path)
+                        continue
+
+                    if (
+                        exts is not None
+                        and os.path.splitext(name)[1].lower() not in exts
+                    ):
+                        continue
+                    if includeRules and not matchRules(includeRules, relPath, name):
+                        continue
+                    if matchRules(excludeRules, relPath, name):
+                        continue
+                    put(path)
+            except (IOError, OSError):
+                pass
+            finally:
+                with lock:
+                    pending[0] -= 1
+                    finished = pending[0] == 0
+                if finished:
+                    put(None)
+                    for i in range(threads):
+                        directories.put(None)
+
+    workers = [threading.Thread(target=work) for i in range(threads)]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    directories.put(root)
+
+    try:
+        while True:
+            try:
+                # the timeout only keeps Ctrl-C working while we wait
+                path = found.get(True, 1)
+            except Queue.Empty:
+                continue
+            if path is None:
+                return
+            yield Path(path)
+    finally:
+        stop.set()
+        for worker in workers:
+            directories.put(None)
 
-        if extension.lower() in exts:
-            files.append(file)
 
-    return files
+def getFiles(folder, exFolders, exts, all=True, include=None, exclude=None):
+    """All matching files below folder (see crawl), sorted."""
+    return sorted(crawl(folder, exts, exFolders, include, exclude, all=all))
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Process wide, size bounded ImageCache shared by all pipeline steps
+
+by David Maus - www.david-maus.de
+
+Written by David Maus / info@david-maus.de, 2018
+"""
+# fmt: off
+
+# -------------------------------------------------------------------------------------
+# Imports
+# -------------------------------------------------------------------------------------
+
+import sys; sys.dont_write_bytecode = True
+import OpenImageIO as oiio
+from OpenImageIO import ImageBuf
+
+# -------------------------------------------------------------------------------------
+# Global vars
+# -------------------------------------------------------------------------------------
+
+cacheMemoryMB       = 1024
+cacheOpenFiles      = 100
+cacheAutotile       = 64
+cacheForceFloat     = False
+
+# stats key -> (ImageCache statistic, type)
+statNames           = {
+    "tileCalls":    ("stat:find_tile_calls", "int64"),
+    "misses":       ("stat:find_tile_cache_misses", "int"),
+    "bytesRead":    ("stat:bytes_read", "int64"),
+    "filesOpened":  ("stat:open_files_created", "int"),
+}
+
+totals              = {}
+
+# -------------------------------------------------------------------------------------
+# Functions
+# -------------------------------------------------------------------------------------
+# fmt: on
+
+
+def shared():
+    return oiio.ImageCache.create(True)
+
+
+def configure(memoryMB=None, openFiles=None, autotile=None, forceFloat=None):
+    """Apply the cache limits to the shared ImageCache; None keeps the module
+    default. Every process (pool workers too) calls this once."""
+    global cacheMemoryMB, cacheOpenFiles, cacheAutotile, cacheForceFloat
+
+    if memoryMB is not None:
+        cacheMemoryMB = memoryMB
+    if openFiles is not None:
+        cacheOpenFiles = openFiles
+    if autotile is not None:
+        cacheAutotile = autotile
+    if forceFloat is not None:
+        cacheForceFloat = forceFloat
+
+    cache = shared()
+    cache.attribute("max_memory_MB", float(cacheMemoryMB))
+    cache.attribute("max_open_files", int(cacheOpenFiles))
+    cache.attribute("autotile", int(cacheAutotile))
+    cache.attribute("autoscanline", 1)
+    cache.attribute("forcefloat", int(cacheForceFloat))
+    return cache
+
+
+def openImage(path, miplevel=0):
+    """ImageBuf for path (or one of its MIP levels), backed by the shared cache.
+
+    The Python bindings always bind file backed buffers to the shared cache,
+    so going through here is what keeps them under the configured limits.
+    """
+    return ImageBuf(str(path), 0, miplevel)
+
+
+def release(*paths):
+    """Drop cached tiles and close the file handles of paths, e.g. before the
+    file gets replaced or deleted."""
+    cache = shared()
+    for path in paths:
+        cache.invalidate(str(path))
+
+
+def stats():
+    """Current statistics of the shared cache of this process."""
+    cache = shared()
+    values = {}
+    for key, (name, typeName) in statNames.items():
+        value = cache.getattribute(name, typeName)
+        values[key] = int(value) if value is not None else 0
+    return values
+
+
+def delta(before, after):
+    return dict((key, after[key] - before.get(key, 0)) for key in after)
+
+
+def collect(values):
+    """Add a stats delta (from this process or a pool worker) to the run totals."""
+    for key, value in values.items():
+        totals[key] = totals.get(key, 0) + value
+
+
+def summary(values=None):
+    values = totals if values is None else values
+    calls = values.get("tileCalls", 0)
+    misses = values.get("misses", 0)
+    return "ImageCache: %d hits, %d misses, %.1f MB read, %d files opened" % (
+        calls - misses,
+        misses,
+        values.get("bytesRead", 0) / 1024.0 / 1024.0,
+        values.get("filesOpened", 0),
+    )
+
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Process pool for per-file pipelines
+
+by David Maus - www.david-maus.de
+
+Written by David Maus / info@david-maus.de, 2018
+"""
+# fmt: off
+
+# -------------------------------------------------------------------------------------
+# Imports
+# -------------------------------------------------------------------------------------
+
+import sys; sys.dont_write_bytecode = True
+import os
+import traceback
+import multiprocessing
+import threading
+import itertools
+import Queue
+from multiprocessing.queues import SimpleQueue
+
+# -------------------------------------------------------------------------------------
+# Global vars
+# -------------------------------------------------------------------------------------
+
+megapixelsPerThread = 4.0
+# seconds between checks for lost workers while waiting for results
+pollInterval        = 1.0
+
+# workers report (batch id, pid) here when they start a batch, see runJobs
+startedBatches      = None
+
+# -------------------------------------------------------------------------------------
+# Functions
+# -------------------------------------------------------------------------------------
+# fmt: on
+
+
+def splitThreads(threads, megapixels):
+    """(files in parallel, threads per op) for a budget of threads.
+
+    One op thread per megapixelsPerThread of the typical image: many small
+    textures run as many files with single threaded ops, a few huge hdrs as
+    few files with wide ops.
+    """
+    opThreads = int(min(threads, max(1, round(megapixels / megapixelsPerThread))))
+    files = max(1, threads // opThreads)
+    # the threads left over by the division go to the ops of the files
+    return files, max(1, threads // files)
+
+
+def cpuCount():
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def _call(func, item):
+    """Run one job inside a worker and hand back (item, result, error)."""
+    try:
+        return item, func(item), None
+    except Exception as e:
+        return item, None, "%s\n%s" % (e, traceback.format_exc())
+
+
+def _initWorker(started, initializer, initargs):
+    global startedBatches
+    startedBatches = started
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _callBatch(func, items, batchId):
+    startedBatches.put((batchId, os.getpid()))
+    return batchId, [_call(func, item) for item in items]
+
+
+def _failBatch(items, error):
+    return [(item, None, error) for item in items]
+
+
+def _collect(pool, running, finished):
+    """Results of the next finished batch, waiting at most pollInterval.
+
+    running maps batch id -> [AsyncResult, items, pid of its worker]. The pool
+    replaces a worker that died (crash, OOM killer) but the batch it ran never
+    finishes, so batches whose worker is gone fail instead of hanging the run;
+    so do batches whose result couldn't be sent back.
+    """
+    try:
+        batchId, results = finished.get(True, pollInterval)
+        # None if the batch was already failed as lost
+        return results if running.pop(batchId, None) is not None else []
+    except Queue.Empty:
+        pass
+
+    # ids are unique per pool, so starts of batches of earlier runs are skipped
+    while not pool.started.empty():
+        batchId, pid = pool.started.get()
+        if batchId in running:
+            running[batchId][2] = pid
+
+    alive = set(worker.pid for worker in pool.pool._pool if worker.exitcode is None)
+    results = []
+    for batchId, (asyncResult, items, pid) in list(running.items()):
+        if asyncResult.ready() and not asyncResult.successful():
+            try:
+                asyncResult.get()
+            except Exception as e:
+                results += _failBatch(items, "Worker failed: %s" % e)
+        elif pid is not None and pid not in alive:
+            results += _failBatch(items, "Worker process %d died" % pid)
+        else:
+            continue
+        del running[batchId]
+    return results
+
+
+def batches(items, size):
+    """Lists of up to size items, without reading ahead of the last one."""
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, size))
+        if len(batch) == 0:
+            return
+        yield batch
+
+
+class WorkerPool(object):
+    """Process pool for runJobs that can serve several runs.
+
+    The workers are forked right away, so create it before this process starts
+    threads of its own (crawl, prefetch): a child forked while another thread
+    holds a lock of OIIO or libc inherits it locked and can wait on it forever.
+    """
+
+    def __init__(self, jobs, initializer=None, initargs=()):
+        self.jobs = jobs
+        self.started = SimpleQueue()
+        self.batchIds = itertools.count()
+        self.pool = multiprocessing.Pool(
+            jobs, _initWorker, (self.started, initializer, initargs)
+        )
+
+    def close(self):
+        # terminate, close() would wait forever on batches of dead workers
+        self.pool.terminate()
+        self.pool.join()
+
+
+def runJobs(
+    func,
+    items,
+    jobs=1,
+    inFlight=None,
+    initializer=None,
+    initargs=(),
+    batch=1,
+    pool=None,
+):
+    """Run func for every item and yield (item, result, error) as jobs finish.
+
+    With jobs <= 1 everything runs inline in the current process. Otherwise a
+    process pool with `jobs` workers is used and at most `inFlight` batches
+    (default: 2 * jobs) are submitted at a time, so the memory held by queued
+    work stays bounded. func has to be a module level function.
+
+    pool is a WorkerPool to use instead of a new one (then jobs, initializer
+    and initargs are those of the pool); the caller closes it.
+
+    Workers get `batch` items per call, which saves the pool round trips of
+    jobs that only take milliseconds, like thumbnails.
+    """
+    if pool is not None:
+        jobs = pool.jobs
+
+    if jobs <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for item in items:
+            yield _call(func, item)
+        return
+
+    if inFlight is None:
+        inFlight = jobs * 2
+
+    ownPool = pool is None
+    if ownPool:
+        pool = WorkerPool(jobs, initializer, initargs)
+    finished = Queue.Queue()
+    running = {}
+
+    try:
+        for items in batches(items, batch):
+            while len(running) >= inFlight:
+                for result in _collect(pool, running, finished):
+                    yield result
+
+            batchId = next(pool.batchIds)
+            asyncResult = pool.pool.apply_async(
+                _callBatch, (func, items, batchId), callback=finished.put
+            )
+            running[batchId] = [asyncResult, items, None]
+
+        # the timed waits in _collect also keep Ctrl-C working on Python 2
+        while len(running) > 0:
+            for result in _collect(pool, running, finished):
+                yield result
+    finally:
+        if ownPool:
+            pool.close()
+
+
+def prefetch(items, ahead=64):
+    """Iterate items on a background thread and yield them here.
+
+    The producer stays at most `ahead` items in front of the consumer, so a
+    fast scan can't fill memory while conversion is still busy. Exceptions
+    of the producer are raised in the consumer.
+    """
+    buffered = Queue.Queue(ahead)
+    stop = threading.Event()
+    finished = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffered.put(item, True, 0.1)
+                return
+            except Queue.Full:
+                pass
+
+    def produce():
+        try:
+            for item in items:
+                put((item, None))
+            put((finished, None))
+        except Exception as e:
+            put((finished, e))
+
+    producer = threading.Thread(target=produce)
+    producer.daemon = True
+    producer.start()
+
+    try:
+        while True:
+            try:
+                # the timeout only keeps Ctrl-C working while we wait
+                item, error = buffered.get(True, 1)
+            except Queue.Empty:
+                continue
+
+            if item is finished:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Crash-safe run journal and atomic output files
+
+by David Maus - www.david-maus.de
+
+Written by David Maus / info@david-maus.de, 2018
+"""
+# fmt: off
+
+# -------------------------------------------------------------------------------------
+# Imports
+# -------------------------------------------------------------------------------------
+
+import sys; sys.dont_write_bytecode = True
+import os
+import json
+import threading
+import contextlib
+from pathlib import Path
+
+# -------------------------------------------------------------------------------------
+# Global vars
+# -------------------------------------------------------------------------------------
+
+# outputs are written as name.partial.ext (the extension picks the file format)
+partialTag          = ".partial"
+partialPattern      = "*" + partialTag + ".*"
+
+# -------------------------------------------------------------------------------------
+# Functions
+# -------------------------------------------------------------------------------------
+# fmt: on
+
+
+def partialPath(path):
+    base, extension = os.path.splitext(str(path))
+    return base + partialTag + extension
+
+
+def replaceFile(src, dst):
+    """Move src over dst, atomically where the platform allows it."""
+    if hasattr(os, "replace"):
+        os.replace(str(src), str(dst))
+    elif os.name != "nt":
+        os.rename(str(src), str(dst))
+    else:
+        # Python 2 on Windows can't rename over an existing file
+        if Path(dst).exists():
+            Path(dst).unlink()
+        os.rename(str(src), str(dst))
+
+
+def discard(path):
+    try:
+        os.remove(str(path))
+    except OSError:
+        pass
+
+
+@contextlib.contextmanager
+def atomicOutput(outFile):
+    """Yields the partial path to write to; it only replaces outFile once the
+    block finished, and is removed if the block fails."""
+    partialFile = partialPath(outFile)
+    try:
+        yield partialFile
+    except BaseException:
+        discard(partialFile)
+        raise
+    replaceFile(partialFile, outFile)
+
+
+class Journal(object):
+    """Append-only log of the outputs a run started, completed or failed.
+
+    Every line is flushed and synced to disk, so after a crash, preemption
+    or Ctrl-C the next run knows which outputs were in progress. A run that
+    finished all it started removes the journal.
+    """
+
+    def __init__(self, journalFile):
+        self.journalFile = Path(journalFile)
+        self.lock = threading.Lock()
+        self.running = {}
+        self.interrupted = {}
+        self.f = None
+
+        try:
+            with open(str(self.journalFile), "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line
+                    self._apply(self.interrupted, entry)
+        except (IOError, OSError):
+            pass
+
+    def _apply(self, entries, entry):
+        key = (entry["kind"], entry["source"])
+        if entry["event"] == "started":
+            entries[key] = entry["output"]
+        else:
+            entries.pop(key, None)
+
+    def recover(self):
+        """Discard what interrupted outputs left behind: partial files and
+        outputs that may predate atomic writes. Returns their paths."""
+        discarded = []
+        for (kind, source), output in sorted(self.interrupted.items()):
+            if output == source:
+                continue
+            for path in [partialPath(output), output]:
+                if Path(path).exists():
+                    discard(path)
+                    discarded.append(path)
+        self.interrupted = {}
+        return discarded
+
+    def _write(self, event, kind, source, output, error=None):
+        entry = {
+            "event": event,
+            "kind": kind,
+            "source": str(source),
+            "output": str(output),
+        }
+        if error is not None:
+            entry["error"] = error
+
+        with self.lock:
+            if self.f is None:
+                self.f = open(str(self.journalFile), "a")
+            self.f.write(json.dumps(entry) + "\n")
+            self.f.flush()
+            os.fsync(self.f.fileno())
+            self._apply(self.running, entry)
+
+    def started(self, kind, source, output):
+        self._write("started", kind, source, output)
+
+    def completed(self, kind, source, output):
+        self._write("completed", kind, source, output)
+
+    def failed(self, kind, source, output, error):
+        self._write("failed", kind, source, output, error)
+
+    def close(self):
+        """Close the journal, and remove it if nothing is left in progress."""
+        with self.lock:
+            if self.f is not None:
+                self.f.close()
+                self.f = None
+            if len(self.running) == 0 and len(self.interrupted) == 0:
+                discard(self.journalFile)
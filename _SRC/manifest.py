@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Build manifest for derived files (make-style dependency tracking)
+
+by David Maus - www.david-maus.de
+
+Written by David Maus / info@david-maus.de, 2018
+"""
+# fmt: off
+
+# -------------------------------------------------------------------------------------
+# Imports
+# -------------------------------------------------------------------------------------
+
+import sys; sys.dont_write_bytecode = True
+import os
+import json
+import threading
+from pathlib import Path
+import journal
+
+# -------------------------------------------------------------------------------------
+# Global vars
+# -------------------------------------------------------------------------------------
+
+manifestVersion     = 1
+
+# -------------------------------------------------------------------------------------
+# Functions
+# -------------------------------------------------------------------------------------
+# fmt: on
+
+
+class BuildManifest(object):
+    """Records for every output the source fingerprint and the parameters used.
+
+    Outputs that already exist but were built before the manifest existed
+    are adopted as up to date instead of forcing a full rebuild.
+    """
+
+    def __init__(self, manifestFile):
+        self.manifestFile = Path(manifestFile)
+        self.root = self.manifestFile.parent
+        self.outputs = {}
+        self.lock = threading.RLock()
+
+        try:
+            with open(str(self.manifestFile), "r") as f:
+                data = json.load(f)
+            if data.get("version") == manifestVersion:
+                self.outputs = data["outputs"]
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+
+    def key(self, path):
+        return os.path.relpath(str(path), str(self.root)).replace("\\", "/")
+
+    def staleReason(self, output, source, fingerprint, params):
+        """Why output has to be (re)built, or None if it is up to date.
+
+        With fingerprint None only the parameters are compared (used for
+        outputs that replace their own source, like the tiled .exr).
+        """
+        record = self.outputs.get(self.key(output))
+
+        if not Path(output).exists():
+            return "missing"
+        if record is None:
+            self.record(output, source, fingerprint, params)
+            return None
+        if fingerprint is not None and record["fingerprint"] != list(fingerprint):
+            return "source changed"
+        if record["params"] != params:
+            return "settings changed"
+        return None
+
+    def record(self, output, source, fingerprint, params):
+        with self.lock:
+            self.outputs[self.key(output)] = {
+                "source": self.key(source),
+                "fingerprint": list(fingerprint) if fingerprint is not None else None,
+                "params": params,
+            }
+
+    def save(self):
+        with self.lock:
+            tmpFile = str(self.manifestFile) + ".tmp"
+            with open(tmpFile, "w") as f:
+                json.dump({"version": manifestVersion, "outputs": self.outputs}, f)
+            journal.replaceFile(tmpFile, self.manifestFile)
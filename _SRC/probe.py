@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Header-only image probing with a persistent metadata index
+
+by David Maus - www.david-maus.de
+
+Written by David Maus / info@david-maus.de, 2018
+"""
+# fmt: off
+
+# -------------------------------------------------------------------------------------
+# Imports
+# -------------------------------------------------------------------------------------
+
+import sys; sys.dont_write_bytecode = True
+import os
+import json
+import hashlib
+import threading
+import OpenImageIO as oiio
+from OpenImageIO import ImageInput
+from pathlib import Path
+import journal
+
+# -------------------------------------------------------------------------------------
+# Global vars
+# -------------------------------------------------------------------------------------
+
+indexVersion        = 1
+hashChunkSize       = 65536
+
+# -------------------------------------------------------------------------------------
+# Functions
+# -------------------------------------------------------------------------------------
+# fmt: on
+
+
+def contentHash(path, size):
+    """Hash of the file size plus its first and last chunk.
+
+    Cheap enough for NFS and still catches files that were replaced with
+    different content while keeping size or mtime.
+    """
+    sha = hashlib.sha1(str(size).encode("ascii"))
+    with open(str(path), "rb") as f:
+        sha.update(f.read(hashChunkSize))
+        if size > hashChunkSize:
+            f.seek(max(hashChunkSize, size - hashChunkSize))
+            sha.update(f.read(hashChunkSize))
+    return sha.hexdigest()
+
+
+def probeFile(path):
+    """Read the header of an image without decoding any pixels."""
+    inp = ImageInput.open(str(path))
+    if inp is None:
+        raise IOError("Could not open %s: %s" % (path, oiio.geterror()))
+
+    try:
+        spec = inp.spec()
+        nmiplevels = 1
+        while inp.seek_subimage(0, nmiplevels):
+            nmiplevels += 1
+    finally:
+        inp.close()
+
+    return {
+        "width": spec.width,
+        "height": spec.height,
+        "nchannels": spec.nchannels,
+        "channelnames": list(spec.channelnames),
+        "format": str(spec.format),
+        "tile_width": spec.tile_width,
+        "tile_height": spec.tile_height,
+        "nmiplevels": nmiplevels,
+    }
+
+
+def needsTiling(header):
+    """Scanline files, single-tile files and files without MipMaps."""
+    return (
+        header["tile_width"] == header["width"]
+        or header["tile_width"] == 0
+        or header["nmiplevels"] == 1
+    )
+
+
+class MetadataIndex(object):
+    """On-disk index of image headers keyed by path, size, mtime and content hash.
+
+    Entries are only re-probed when the file changed since the last run.
+    """
+
+    def __init__(self, indexFile):
+        self.indexFile = Path(indexFile)
+        self.root = self.indexFile.parent
+        self.entries = {}
+        self.seen = set()
+        self.probed = 0
+        # the scan may run on another thread than checkpoints
+        self.lock = threading.RLock()
+
+        try:
+            with open(str(self.indexFile), "r") as f:
+                data = json.load(f)
+            if data.get("version") == indexVersion:
+                self.entries = data["files"]
+            # output state of older versions, never read
+            for entry in self.entries.values():
+                entry.pop("outputs", None)
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+
+    def key(self, path):
+        return os.path.relpath(str(path), str(self.root)).replace("\\", "/")
+
+    def fingerprint(self, path):
+        """(size, mtime, hash) of path, hashing only when size/mtime changed."""
+        stat = os.stat(str(path))
+        entry = self.entries.get(self.key(path))
+
+        if entry is not None and (entry["size"], entry["mtime"]) == (
+            stat.st_size,
+            stat.st_mtime,
+        ):
+            return entry["size"], entry["mtime"], entry["hash"]
+
+        return stat.st_size, stat.st_mtime, contentHash(path, stat.st_size)
+
+    def sourceFingerprint(self, path):
+        """[size, hash] of path, the part of the fingerprint that tracks content."""
+        size, mtime, fileHash = self.fingerprint(path)
+        return [size, fileHash]
+
+    def header(self, path):
+        """Header of path, from the index if the file did not change."""
+        key = self.key(path)
+        entry = self.entries.get(key)
+        size, mtime, fileHash = self.fingerprint(path)
+
+        if entry is None or (entry["size"], entry["hash"]) != (size, fileHash):
+            entry = {"header": probeFile(path)}
+            self.probed += 1
+
+        with self.lock:
+            entry.update(size=size, mtime=mtime, hash=fileHash)
+            self.entries[key] = entry
+            self.seen.add(key)
+        return entry["header"]
+
+    def save(self, prune=True):
+        """Write the index, dropping entries of files not seen in this run
+        unless prune is False (checkpoints while the scan is still going)."""
+        with self.lock:
+            files = dict(
+                (k, v) for k, v in self.entries.items() if k in self.seen or not prune
+            )
+            self.entries = files
+
+            tmpFile = str(self.indexFile) + ".tmp"
+            with open(tmpFile, "w") as f:
+                json.dump({"version": indexVersion, "files": files}, f)
+            journal.replaceFile(tmpFile, self.indexFile)
@@ -29,8 +29,6 @@ from colorama import init, Fore, Back, Style
 init(
     strip=not sys.stdout.isatty(), autoreset=True
 )  # strip colors if stdout is redirected
-from termcolor import cprint
-from pyfiglet import figlet_format
 import OpenImageIO as oiio
 from OpenImageIO import ImageInput, ImageOutput
 from OpenImageIO import ImageBuf, ImageSpec, ImageBufAlgo
@@ -39,7 +37,23 @@ import shlex
 import struct
 import platform
 import subprocess
+import multiprocessing
+import functools
+import itertools
 import folder
+import jobs
+import probe
+import manifest
+import blur
+import progress
+import stream
+import imagecache
+import report
+import task
+import journal
+import atlas
+import color
+import stages
 import argparse
 from argparse import RawTextHelpFormatter
 # import win_unicode_console
@@ -72,24 +86,131 @@ os.environ["QT_AUTO_SCREEN_SCALE_FACTOR"] = "1"
 tiledPrefix         = "-tiled"
 blurredPrefix       = "-blurred"
 mipmapPrefix        = "-mipmap"
+resizedPrefix       = "-resized"
 
 hdrExtension        = ".exr"
 mipmapExtension     = ".tx"
 thumbnailExtension  = ".jpg"
+indexFilename       = "_txConverterIndex.json"
+manifestFilename    = "_txConverterManifest.json"
+journalFilename     = "_txConverterJournal.jsonl"
+atlasFilename       = "_previewAtlas.png"
+atlasIndexFilename  = "_previewAtlas.json"
+
+hdrTasks            = ("tiling", "blurring", "preview")
 
 thumbnailWidth      = 270
+# previews per pool call, they only take milliseconds each
+thumbnailBatch      = 16
+# preview look: exposure in stops and view curve, see color.views
+previewExposure     = 0.0
+previewView         = "standard"
+# bake the preview color transform into a numpy 1D LUT
+colorLUT            = False
+# custom numpy stages per output, "name[:arg]", see stages.py
+envStages           = []
+blurStages          = []
+previewStages       = []
 hdrWidth            = 8192
 hdrBlurWidth        = 4096
 
-tileSize            = 64
+# per output kind: "auto" (see pickTileSize) or a fixed 32/64/128/256
+envTileSize         = "auto"
+blurTileSize        = "auto"
+textureTileSize     = "auto"
+tileSizeChoices     = [32, 64, 128, 256]
+# auto: largest tile with at most this many bytes and 16 tiles across
+tileBudgetBytes     = 256 * 1024
+tileMinCount        = 16
+
+exrCompression      = "zip"
+# source: keep the data format of the buffer, auto: 8/16 bit stays integer,
+# float becomes half unless values exceed the half range; half; float
+dataFormat          = "source"
+dataFormats         = ["source", "auto", "half", "float"]
+exrCodecs           = ["none", "rle", "zips", "zip", "piz", "pxr24", "b44", "b44a", "dwaa", "dwab"]
+tiffCodecs          = ["none", "zip", "lzw"]
+halfMax             = 65504.0
+# dataFormat auto decides on the source, resize filters may overshoot it a bit
+halfHeadroom        = 1.1
 
 blurAmountX         = 25.0
 blurAmountY         = 35.0
 blurFilter          = "bspline"
+blurEngine          = "convolve"
 resizeFilter        = "mitchell"
-
-errorFlag           = 0
-threadResult        = Queue.Queue()
+# blurred and preview outputs start from a MIP level of tiled files
+mipReuse            = True
+
+# settings each output depends on, a change forces a rebuild
+outputSettings      = {
+    "tiling":   ["hdrWidth", "resizeFilter", "envTileSize", "exrCompression", "dataFormat", "envStages"],
+    "blurring": ["hdrBlurWidth", "resizeFilter", "blurFilter", "blurEngine", "blurAmountX", "blurAmountY", "blurTileSize", "exrCompression", "dataFormat", "mipReuse", "blurStages"],
+    "preview":  ["thumbnailWidth", "resizeFilter", "mipReuse", "previewExposure", "previewView", "previewStages"],
+    "mipmap":   ["textureTileSize", "exrCompression", "dataFormat"],
+}
+# settings that were removed, recorded at their last value so the parameters
+# of existing outputs still compare equal
+retiredSettings     = {
+    "tiling":   {"tileSize": 64},
+    "blurring": {"tileSize": 64},
+    "mipmap":   {"tileSize": 64},
+}
+# settings added after outputs were first recorded; at these values they are
+# left out of the recorded parameters so existing outputs stay up to date
+legacyDefaults      = {
+    "exrCompression":   "zip",
+    "dataFormat":       "source",
+    "envTileSize":      "auto",
+    "blurTileSize":     "auto",
+    "textureTileSize":  "auto",
+    "mipReuse":         True,
+    "previewExposure":  0.0,
+    "previewView":      "standard",
+    "envStages":        [],
+    "blurStages":       [],
+    "previewStages":    [],
+}
+# settings that don't change outputs but have to reach pool workers
+runtimeSettings     = [
+    "memoryBudgetMB",
+    "cacheMemoryMB",
+    "cacheOpenFiles",
+    "cacheForceFloat",
+    "opThreads",
+    "colorLUT",
+]
+# rough (seconds per file, seconds per source megapixel) for --dry-run estimates
+buildCost           = {
+    "tiling":   (0.5, 0.08),
+    "blurring": (6.0, 0.02),
+    "preview":  (0.2, 0.04),
+    "mipmap":   (0.2, 0.06),
+}
+
+jobCount            = 1
+# --threads budget, split into jobCount files x opThreads per op (0: OIIO default)
+threadBudget        = None
+jobsGiven           = False
+opThreads           = 0
+# jobs.WorkerPool of the run, see startWorkers
+workerPool          = None
+pipelineMode        = False
+buildAtlas          = False
+dryRun              = False
+batchMode           = False
+bannerCache         = {}
+memoryBudgetMB      = 0
+cacheMemoryMB       = imagecache.cacheMemoryMB
+cacheOpenFiles      = imagecache.cacheOpenFiles
+cacheForceFloat     = imagecache.cacheForceFloat
+runReport           = report.RunReport()
+# probed textures waiting for conversion, before the scan has to wait
+scanAhead           = 64
+# textures the --threads split is based on when streaming
+threadSample        = 16
+# results between saves of the index and manifest, so a crash loses little work
+checkpointEvery     = 50
 prefix              = _term_move_up() + '\r'
 barFormat           = "{desc:<9}{percentage:3.0f}%|{bar}| {n_fmt:<4}/{total_fmt:<4} {elapsed}<{remaining:<6}, {rate_fmt:<11}{postfix}"
 
@@ -233,11 +354,9 @@ def _get_terminal_size_linux():
 
 
 def clearTerminal():
-    # os.system("cls||clear")
-
-    command = "cls" if platform.system().lower() == "windows" else "clear"
-    os.system(command)
-    # tqdm.write("\n" * getTerminalSize()[0])
+    # clear screen + cursor home, translated by colorama on windows
+    sys.stdout.write("\033[2J\033[H")
+    sys.stdout.flush()
 
 
 def wait_key():
@@ -267,16 +386,39 @@ def wait_key():
     return result
 
 
+def pause(seconds):
+    if not batchMode:
+        time.sleep(seconds)
+
+
+def exitPrompt():
+    if not batchMode:
+        tqdm.write(prefix + "Press Enter to exit or close the Terminal")
+        wait_key()
+
+
+def renderBanner(width):
+    """figlet banner, rendered once per terminal width."""
+    if width not in bannerCache:
+        from pyfiglet import figlet_format
+
+        bannerCache[width] = figlet_format(
+            __title__, font="3-d", justify="center", width=width
+        ).center(width)
+    return bannerCache[width]
+
+
 def showUI(title, content):
+    if batchMode:
+        if title or content:
+            tqdm.write(" ".join(part for part in [title, content] if part))
+        return
+
+    from termcolor import cprint
+
     clearTerminal()
 
-    cprint(
-        figlet_format(__title__, font="3-d", justify="center", width=width).center(
-            width
-        ),
-        "red",
-        attrs=["bold"],
-    )
+    cprint(renderBanner(width), "red", attrs=["bold"])
     cprint((__subTitle__).center(width), "green")
     cprint((__desc__).center(width), "red")
     cprint(("-" * width).center(width), "red")
@@ -286,35 +428,66 @@ def showUI(title, content):
     tqdm.write(prefix + "\n")
 
 
-def threadAndStatus(targetFunc, args, name, id, result):
-    if len(args) == 0:
+class ConversionError(Exception):
+    pass
 
-        t1 = threading.Thread(target=targetFunc, args=[args])
-    else:
-        t1 = threading.Thread(target=targetFunc, args=(args))
+
+def runTarget(targetFunc, args, name, events):
+    progress.listen(events)
+    progress.done(task.run(name, targetFunc, args))
+
+
+def threadAndStatus(targetFunc, args, name, id):
+    """Run a step in a thread and show the pixels it reports in a status bar.
+
+    The bar only moves on progress events and returns the TaskResult of the
+    step as soon as it reports it is done.
+    """
+    events = Queue.Queue()
+    t1 = threading.Thread(target=runTarget, args=(targetFunc, args, name, events))
 
     t1.start()
 
     pbar = tqdm(
-        total=100,
+        total=1,
         ncols=width,
         leave=True,
         position=id,
         desc=name,
         ascii=True,
+        unit="MPix",
+        unit_scale=True,
         bar_format=barFormat,
+        disable=batchMode,
     )
-    while t1.is_alive() and errorFlag == 0:
-        pbar.update(0.1)
-        time.sleep(0.5)
+    while True:
+        try:
+            # the timeout only keeps Ctrl-C working while we wait
+            kind, value = events.get(True, 1)
+        except Queue.Empty:
+            continue
+
+        if kind == "total":
+            pbar.total = value / 1.0e6
+            pbar.refresh()
+        elif kind == "progress":
+            pbar.update(value / 1.0e6)
+        elif kind == "bytes":
+            pbar.set_postfix_str(tqdm.format_sizeof(value, "B", 1024))
+        elif kind == "done":
+            break
+
     t1.join()
-    pbar.n = 100
+    pbar.n = pbar.total
     pbar.refresh()
     pbar.close()
-    if result is True:
-        return threadResult.get()
-    else:
-        True
+
+    return value
+
+
+def runStep(targetFunc, args, name, id):
+    """Run a pipeline step inline, without status bar (used by pool workers)."""
+    return task.run(name, targetFunc, args)
 
 
 def calculateResizeHeight(origWidth, origHeight, newWidth):
@@ -324,10 +497,16 @@ def calculateResizeHeight(origWidth, origHeight, newWidth):
 
 
 def convertColor(srcBuffer, fromColor="linear", toColor="sRGB"):
-    Dst = ImageBuf()
-    ImageBufAlgo.colorconvert(Dst, srcBuffer, fromColor, toColor)
-    threadResult.put(Dst)
-    return Dst
+    """Color conversion with the preview exposure and view curve."""
+    return color.convert(
+        srcBuffer,
+        fromColor,
+        toColor,
+        previewView,
+        previewExposure,
+        colorLUT,
+        opThreads,
+    )
 
 
 def resizeHDR(scrBuffer, width, height):
@@ -336,309 +515,967 @@ def resizeHDR(scrBuffer, width, height):
     resizedBuffer = ImageBuf(
         ImageSpec(width, height, srcSpec.nchannels, srcSpec.format)
     )
-    ImageBufAlgo.resize(resizedBuffer, scrBuffer, filtername=resizeFilter)
-    threadResult.put(resizedBuffer)
+
+    progress.total(width * height)
+    for roi in progress.strips(resizedBuffer.spec()):
+        ImageBufAlgo.resize(
+            resizedBuffer,
+            scrBuffer,
+            filtername=resizeFilter,
+            roi=roi,
+            nthreads=opThreads,
+        )
+        progress.advance(roi.width * roi.height)
+
     return resizedBuffer
 
 
 def writeJPG(scrBuffer, outFile):
-    global errorFlag
+    spec = scrBuffer.spec()
+    progress.total(spec.width * spec.height)
+
+    scrBuffer.specmod().attribute("quality", 80)
+    with journal.atomicOutput(outFile) as partialFile:
+        if not scrBuffer.write(partialFile):
+            raise IOError(scrBuffer.geterror())
+
+    progress.advance(spec.width * spec.height)
+    progress.written(os.path.getsize(outFile))
+
+    return outFile
+
+
+def maxValue(scrBuffer):
+    stats = oiio.PixelStats()
+    ImageBufAlgo.computePixelStats(stats, scrBuffer)
+    return max(stats.max)
+
+
+def sourcePeak(srcBuffer):
+    """maxValue of a decoded source for dataFormat auto, so the outputs made
+    from it don't scan their pixels again; None where it isn't needed."""
+    if dataFormat != "auto":
+        return None
+    if str(srcBuffer.nativespec().format) in ("uint8", "uint16"):
+        return None
+    return maxValue(srcBuffer) * halfHeadroom
+
+
+def outputFormat(scrBuffer, peak=None):
+    """Data format for a written .exr/.tx according to dataFormat, None keeps
+    the format of the buffer. peak is the sourcePeak of the buffer, if known."""
+    if dataFormat == "half":
+        return oiio.HALF
+    if dataFormat == "float":
+        return oiio.FLOAT
+    if dataFormat == "auto":
+        # the file format, the cache may have promoted the pixels to float
+        if str(scrBuffer.nativespec().format) in ("uint8", "uint16"):
+            return scrBuffer.nativespec().format
+        if peak is None:
+            peak = maxValue(scrBuffer)
+        return oiio.FLOAT if peak > halfMax else oiio.HALF
+    return None
+
+
+def pickTileSize(spec, outFormat):
+    """Largest tile that stays within tileBudgetBytes and leaves at least
+    tileMinCount tiles across the image: big tiles for 8k environments (fewer,
+    larger reads), small ones for small textures (less padding waste)."""
+    pixelBytes = spec.nchannels * oiio.TypeDesc(outFormat).size()
+    longSide = max(spec.width, spec.height)
+
+    for size in reversed(tileSizeChoices):
+        fitsBudget = size * size * pixelBytes <= tileBudgetBytes
+        if fitsBudget and size * tileMinCount <= longSide:
+            return size
+    return tileSizeChoices[0]
+
+
+def outputConfig(scrBuffer, codecs, tileSetting, peak=None):
+    """make_texture settings shared by writeEXR and writeTexture: filter,
+    compression (zip if the container doesn't know the codec), data format
+    and tile size."""
+    config = ImageSpec()
+    # config.attribute("maketx:highlightcomp", 1)
+    config.attribute("maketx:filtername", "lanczos3")
+    config.attribute("maketx:oiio options", 1)
+
+    codec = exrCompression.split(":")[0]
+    config.attribute("compression", exrCompression if codec in codecs else "zip")
+
+    outFormat = outputFormat(scrBuffer, peak)
+    if outFormat is not None:
+        config.set_format(outFormat)
+    else:
+        outFormat = scrBuffer.spec().format
 
-    try:
-        scrBuffer.specmod().attribute("quality", 80)
-        scrBuffer.write(outFile)
+    if tileSetting == "auto":
+        tileSetting = pickTileSize(scrBuffer.spec(), outFormat)
+    config.tile_width = config.tile_height = int(tileSetting)
+    config.tile_depth = 1
 
-        errorFlag = 0
+    return config
 
-    except Exception as e:
-        errorFlag = 1
 
-        tqdm.write(
-            prefix
-            + Fore.RED
-            + "Error on conversion. Maybe wrong/corrupt .hdr file or resolution too high (over 8192)."
+def writeEXR(scrBuffer, outFile, kind="env", peak=None):
+    """Latlong environment .exr, kind "env" or "blurred" picks the tile size
+    setting."""
+    config = outputConfig(
+        scrBuffer, exrCodecs, blurTileSize if kind == "blurred" else envTileSize, peak
+    )
+    config.attribute("maketx:opaquedetect", 1)
+
+    spec = scrBuffer.spec()
+    progress.total(spec.width * spec.height)
+
+    scrBuffer.set_write_tiles(config.tile_width, config.tile_height)
+
+    with journal.atomicOutput(outFile) as partialFile:
+        if not ImageBufAlgo.make_texture(
+            oiio.MakeTxEnvLatl, scrBuffer, partialFile, config
+        ):
+            raise IOError(oiio.geterror())
+
+    progress.advance(spec.width * spec.height)
+    progress.written(os.path.getsize(outFile))
+
+    return outFile
+
+
+def writeTexture(scrBuffer, outFile):
+    # .tx files are tiffs
+    config = outputConfig(scrBuffer, tiffCodecs, textureTileSize)
+    # config.attribute("maketx:opaquedetect", 1)
+
+    spec = scrBuffer.spec()
+    progress.total(spec.width * spec.height)
+
+    scrBuffer.set_write_tiles(config.tile_width, config.tile_height)
+
+    with journal.atomicOutput(outFile) as partialFile:
+        if not ImageBufAlgo.make_texture(
+            oiio.MakeTxTexture, scrBuffer, partialFile, config
+        ):
+            raise IOError(oiio.geterror())
+
+    progress.advance(spec.width * spec.height)
+    progress.written(os.path.getsize(outFile))
+
+    return outFile
+
+
+def applyStages(srcBuffer, names, kind):
+    """Custom numpy stages of the output kind; what they note down, like
+    luminance statistics, goes into the --report record of the file."""
+    Dst, info = stages.run(srcBuffer, names)
+    report.note(kind, info)
+    return Dst
+
+
+def blurImage(srcBuffer):
+    return blur.blur(srcBuffer, blurEngine, blurFilter, blurAmountX, blurAmountY)
+
+
+# -------------------------------------------------------------------------------------
+# Per-file pipelines
+# -------------------------------------------------------------------------------------
+
+
+def resizedPath(hdrFile):
+    """Temporary file of streamResizeHDR, named like a partial output so scans
+    skip it."""
+    return journal.partialPath(
+        Path(hdrFile).parent / (Path(hdrFile).stem + resizedPrefix + hdrExtension)
+    )
+
+
+def streamResizeHDR(hdrFile, width, height):
+    """Resize hdrFile into a temporary scanline .exr within memoryBudgetMB."""
+    resizedFile = resizedPath(hdrFile)
+    return stream.resizeToFile(
+        hdrFile, resizedFile, width, height, resizeFilter, memoryBudgetMB
+    )
+
+
+def mipLevels(path):
+    """Cache backed ImageBufs of the MIP levels of path below the full image."""
+    nmiplevels = imagecache.openImage(path).nmiplevels
+    return [imagecache.openImage(path, level) for level in range(1, nmiplevels)]
+
+
+def loadHDR(hdrFile, width, step, mipmaps=False):
+    """ImageBuf of hdrFile and None, or - if the full image does not fit the
+    memory budget - of a streamed resize to `width` and its temporary file.
+
+    With mipmaps the smallest MIP level at least `width` wide is used, so
+    tiled files don't have to be resized from full resolution again.
+    """
+    frameBuffer = imagecache.openImage(hdrFile)
+    if mipmaps and mipReuse:
+        frameBuffer = closestBuffer([frameBuffer] + mipLevels(hdrFile), width)
+    spec = frameBuffer.spec()
+
+    if spec.width <= width or not stream.exceedsBudget(spec, memoryBudgetMB):
+        return frameBuffer, None
+
+    newHeight = calculateResizeHeight(spec.width, spec.height, width)
+    resizedFile = step(
+        streamResizeHDR, [hdrFile, width, newHeight], "Streaming", 1
+    ).get()
+    return imagecache.openImage(resizedFile), resizedFile
+
+
+def releaseHDR(hdrFile, resizedFile):
+    """Close cached file handles and remove the temporary resize of loadHDR."""
+    imagecache.release(hdrFile)
+
+    if resizedFile is not None:
+        imagecache.release(resizedFile)
+        Path(resizedFile).unlink()
+
+
+def tileHDRFile(hdrFile, step=runStep):
+    """Resize -> tiled/mipmapped .exr, then replace the original file with it."""
+
+    directory = Path(hdrFile).parent
+    filename = Path(hdrFile).stem
+
+    frameBufferOrig, resizedFile = loadHDR(hdrFile, hdrWidth, step)
+    spec = frameBufferOrig.spec()
+
+    outPutFile = str(Path(directory, filename + tiledPrefix + hdrExtension))
+
+    if spec.width > hdrWidth:
+
+        newHeight = calculateResizeHeight(spec.width, spec.height, hdrWidth)
+        frameBufferOrig = step(
+            resizeHDR, [frameBufferOrig, hdrWidth, newHeight], "Resizing", 1
+        ).get()
+
+    if len(envStages) != 0:
+        frameBufferOrig = step(
+            applyStages, [frameBufferOrig, envStages, "env"], "Stages", 1
+        ).get()
+
+    saved = step(writeEXR, [frameBufferOrig, outPutFile], "Saving", 0)
+
+    releaseHDR(hdrFile, resizedFile)
+
+    if not saved.ok:
+        raise ConversionError(
+            "Something went wrong on conversion. File not deleted. %s" % saved.error
+        )
+    if not Path(hdrFile).exists():
+        raise ConversionError(
+            "Error: %s not found. Could not delete the File." % hdrFile
         )
 
+    return replaceOriginal(hdrFile, outPutFile)
 
-def writeEXR(scrBuffer, outFile):
-    global errorFlag
 
-    try:
+def replaceOriginal(hdrFile, tiledFile):
+    """Move the tiled .exr over the original. The original is only deleted once
+    its replacement is in place (.hdr/.tif sources get a new name)."""
+    newFile = Path(hdrFile).with_suffix(hdrExtension)
+    journal.replaceFile(tiledFile, newFile)
+    if str(newFile) != str(hdrFile):
+        Path(hdrFile).unlink()
+    return newFile
 
-        config = ImageSpec()
-        # config.attribute("maketx:highlightcomp", 1)
-        config.attribute("maketx:filtername", "lanczos3")
-        config.attribute("maketx:opaquedetect", 1)
-        config.attribute("maketx:oiio options", 1)
 
-        scrBuffer.set_write_tiles(tileSize, tileSize)
+def blurHDRFile(hdrFile, step=runStep):
+    """Resize -> blur -> blurred .exr in the blurred folder."""
 
-        ImageBufAlgo.make_texture(oiio.MakeTxEnvLatl, scrBuffer, outFile, config)
+    filename = Path(hdrFile).stem
 
-        errorFlag = 0
+    frameBufferOrig, resizedFile = loadHDR(hdrFile, hdrBlurWidth, step, True)
+    spec = frameBufferOrig.spec()
 
-    except Exception as e:
-        errorFlag = 1
+    outPutFile = str(Path(hdrBlurFolder, filename + blurredPrefix + hdrExtension))
 
-        tqdm.write(
-            prefix
-            + Fore.RED
-            + "Error on conversion. Maybe wrong/corrupt .hdr file or resolution too high (over 8192)."
+    newHeight = calculateResizeHeight(spec.width, spec.height, hdrBlurWidth)
+
+    resizedFramebuffer = frameBufferOrig
+    if spec.width != hdrBlurWidth:
+        resizedFramebuffer = step(
+            resizeHDR, [frameBufferOrig, hdrBlurWidth, newHeight], "Resizing", 2
+        ).get()
+    if len(blurStages) != 0:
+        resizedFramebuffer = step(
+            applyStages, [resizedFramebuffer, blurStages, "blurred"], "Stages", 2
+        ).get()
+    blurredFramebuffer = step(blurImage, [resizedFramebuffer], "Blurring", 1).get()
+    saved = step(writeEXR, [blurredFramebuffer, outPutFile, "blurred"], "Saving", 0)
+
+    releaseHDR(hdrFile, resizedFile)
+
+    if not saved.ok:
+        raise ConversionError(
+            "Error on conversion. Maybe wrong/corrupt .hdr file or resolution too high (over 8192). %s"
+            % saved.error
         )
 
+    return outPutFile
 
-def writeTexture(scrBuffer, outFile):
-    global errorFlag
 
-    try:
+def previewHDRFile(hdrFile, step=runStep):
+    """Smallest MIP level -> resize -> colorconvert -> thumbnail .jpg in the
+    previews folder. Converting after the resize only touches the thumbnail."""
 
-        config = ImageSpec()
-        # config.attribute("maketx:highlightcomp", 1)
-        config.attribute("maketx:filtername", "lanczos3")
-        # config.attribute("maketx:opaquedetect", 1)
-        config.attribute("maketx:oiio options", 1)
+    filename = Path(hdrFile).stem
 
-        scrBuffer.set_write_tiles(tileSize, tileSize)
+    frameBufferOrig, resizedFile = loadHDR(hdrFile, thumbnailWidth, step, True)
+    spec = frameBufferOrig.spec()
 
-        ImageBufAlgo.make_texture(oiio.MakeTxTexture, scrBuffer, outFile, config)
+    outPutFile = str(Path(hdrPrevFolder, filename + thumbnailExtension))
 
-        errorFlag = 0
+    newHeight = calculateResizeHeight(spec.width, spec.height, thumbnailWidth)
 
-    except Exception as e:
-        errorFlag = 1
+    resizedFramebuffer = frameBufferOrig
+    if spec.width != thumbnailWidth:
+        resizedFramebuffer = step(
+            resizeHDR, [frameBufferOrig, thumbnailWidth, newHeight], "Resizing", 2
+        ).get()
+    if len(previewStages) != 0:
+        resizedFramebuffer = step(
+            applyStages, [resizedFramebuffer, previewStages, "preview"], "Stages", 2
+        ).get()
+    sRGBBuffer = step(
+        convertColor, [resizedFramebuffer, "linear", "sRGB"], "Lin2sRGB", 1
+    ).get()
+    saved = step(writeJPG, [sRGBBuffer, outPutFile], "Saving", 0)
 
-        tqdm.write(
-            prefix
-            + Fore.RED
-            + "Error on conversion. Maybe wrong/corrupt texture file or resolution too high."
+    releaseHDR(hdrFile, resizedFile)
+
+    if not saved.ok:
+        raise ConversionError(
+            "Error on conversion. Maybe wrong/corrupt .hdr file or resolution too high (over 8192). %s"
+            % saved.error
         )
 
+    return outPutFile
 
-def blurImage(srcBuffer):
-    K = ImageBuf()
-    ImageBufAlgo.make_kernel(K, blurFilter, blurAmountX, blurAmountY)
-    Blurred = ImageBuf()
-    ImageBufAlgo.convolve(Blurred, srcBuffer, K)
 
-    threadResult.put(Blurred)
-    return Blurred
+def convertTextureFile(texture, step=runStep):
+    """Texture -> tiled/mipmapped .tx next to the original."""
 
+    directory = Path(texture).parent
+    filename = Path(texture).stem
 
-# -------------------------------------------------------------------------------------
-# Main
-# -------------------------------------------------------------------------------------
+    frameBufferOrig = imagecache.openImage(texture)
 
+    outPutFile = str(Path(directory, filename + mipmapPrefix + mipmapExtension))
 
-def processHDRs():
-    """Main entry point of the app."""
+    saved = step(writeTexture, [frameBufferOrig, outPutFile], "Saving", 0)
 
-    if not Path(hdrPrevFolder).exists():
-        Path(hdrPrevFolder).mkdir(parents=True)
-    if not Path(hdrBlurFolder).exists():
-        Path(hdrBlurFolder).mkdir(parents=True)
+    imagecache.release(texture)
 
-    hdrFiles = folder.getFiles(hdrFolder, "", hdrExts, all=False)
-    previewFiles = folder.getFiles(hdrPrevFolder, "", hdrPrevExts, all=False)
+    if not saved.ok:
+        raise ConversionError(
+            "Error on conversion. Maybe wrong/corrupt texture file or resolution too high. %s"
+            % saved.error
+        )
 
-    hdrFilesTiling = []
-    hdrFilesBlurring = []
-    hdrFilesPreview = []
+    return outPutFile
 
-    hdrFilesPreviewNames = []
 
-    for previewFile in previewFiles:
+def closestBuffer(buffers, width):
+    """Smallest buffer that is still at least `width` pixels wide."""
+    candidates = [b for b in buffers if b.spec().width >= width]
+    if len(candidates) == 0:
+        return buffers[0]
+    return min(candidates, key=lambda b: b.spec().width)
 
-        directory = Path(previewFile).parent
-        filename = Path(previewFile).stem
-        extension = Path(previewFile).suffix
 
-        hdrFilesPreviewNames.append(filename)
+def processHDRFile(hdrFile, step=runStep, tasks=None):
+    """Decode hdrFile once and fan it out to the tiled, blurred and preview outputs.
+
+    tasks maps files to the outputs they need ("tiling", "blurring", "preview").
+    Every resized intermediate is kept, so the blur resize starts from the
+    already downscaled tiling buffer and the thumbnail from the blur resize.
+    The MIP levels of the tiled output (or of an already tiled source) join
+    them, so a matching level spares the resize completely.
+    """
+
+    directory = Path(hdrFile).parent
+    filename = Path(hdrFile).stem
+    fileTasks = tasks[hdrFile] if tasks is not None else hdrTasks
+
+    spec = imagecache.openImage(hdrFile).spec()
+
+    # without tiling a tiled source only has to be read at the size of the
+    # largest output left: the blur, or just the thumbnail
+    if "tiling" in fileTasks:
+        frameBufferOrig, resizedFile = loadHDR(hdrFile, hdrWidth, step)
+    elif "blurring" in fileTasks:
+        frameBufferOrig, resizedFile = loadHDR(hdrFile, hdrBlurWidth, step, True)
+    else:
+        frameBufferOrig, resizedFile = loadHDR(hdrFile, thumbnailWidth, step, True)
+    frameBufferOrig.read(0, frameBufferOrig.miplevel, True)
+
+    releaseHDR(hdrFile, resizedFile)
+
+    # custom stages can change the range, their outputs are measured again
+    peak = sourcePeak(frameBufferOrig)
+
+    buffers = [frameBufferOrig]
+    outputs = {}
+    errors = []
+
+    def resized(newWidth, id):
+        srcBuffer = closestBuffer(buffers, newWidth)
+        if srcBuffer.spec().width == newWidth:
+            return srcBuffer
+        newHeight = calculateResizeHeight(spec.width, spec.height, newWidth)
+        buffers.append(
+            step(resizeHDR, [srcBuffer, newWidth, newHeight], "Resizing", id).get()
+        )
+        return buffers[-1]
+
+    def staged(srcBuffer, names, kind, id):
+        """srcBuffer after the custom stages of an output, as a TaskResult."""
+        if len(names) == 0:
+            return task.TaskResult("Stages", srcBuffer)
+        return step(applyStages, [srcBuffer, names, kind], "Stages", id)
+
+    # a failing stage only drops the output it belongs to
+    if "tiling" in fileTasks:
+        tiledFile = str(Path(directory, filename + tiledPrefix + hdrExtension))
+        saved = staged(resized(min(spec.width, hdrWidth), 1), envStages, "env", 1)
+        if saved.ok:
+            saved = step(
+                writeEXR,
+                [saved.value, tiledFile, "env", None if envStages else peak],
+                "Saving",
+                0,
+            )
+        if saved.ok:
+            outputs["tiling"] = tiledFile
+        else:
+            errors.append(
+                "Something went wrong on conversion. File not deleted. %s" % saved.error
+            )
+
+    mipFile = outputs.get("tiling", hdrFile)
+    if mipReuse:
+        buffers.extend(mipLevels(mipFile))
+
+    if "blurring" in fileTasks:
+        blurFile = str(Path(hdrBlurFolder, filename + blurredPrefix + hdrExtension))
+        saved = staged(resized(hdrBlurWidth, 2), blurStages, "blurred", 2)
+        if saved.ok:
+            saved = step(blurImage, [saved.value], "Blurring", 1)
+        if saved.ok:
+            saved = step(
+                writeEXR,
+                [saved.value, blurFile, "blurred", None if blurStages else peak],
+                "Saving",
+                0,
+            )
+        if saved.ok:
+            outputs["blurring"] = blurFile
+        else:
+            errors.append(
+                "Error on conversion. Maybe wrong/corrupt .hdr file or resolution too high (over 8192). %s"
+                % saved.error
+            )
+
+    if "preview" in fileTasks:
+        previewFile = str(Path(hdrPrevFolder, filename + thumbnailExtension))
+        saved = staged(resized(thumbnailWidth, 2), previewStages, "preview", 2)
+        if saved.ok:
+            saved = step(convertColor, [saved.value, "linear", "sRGB"], "Lin2sRGB", 1)
+        if saved.ok:
+            saved = step(writeJPG, [saved.value, previewFile], "Saving", 0)
+        if saved.ok:
+            outputs["preview"] = previewFile
+        else:
+            errors.append(
+                "Error on conversion. Maybe wrong/corrupt .hdr file or resolution too high (over 8192). %s"
+                % saved.error
+            )
+
+    del buffers[:]
+    imagecache.release(mipFile)
+
+    if "tiling" in outputs:
+        outputs["tiling"] = replaceOriginal(hdrFile, outputs["tiling"])
+
+    if len(errors) != 0:
+        raise ConversionError(" ".join(errors))
+
+    return outputs
+
+
+def workerSettings():
+    """Settings handed to pool workers, which don't see command line changes on
+    platforms that spawn instead of fork."""
+    names = set(name for names in outputSettings.values() for name in names)
+    names.update(runtimeSettings)
+    return dict((name, globals()[name]) for name in names)
+
+
+def initWorker(settings):
+    globals().update(settings)
+    configureCache()
+    configureThreads()
+
+
+def configureThreads():
+    """Threads of OIIO operations in this process; make_texture and file I/O
+    follow the global attributes, our own ImageBufAlgo calls get nthreads."""
+    oiio.attribute("threads", opThreads)
+    oiio.attribute("exr_threads", opThreads)
+    blur.nthreads = opThreads
+
+
+def splitNeedsHeaders():
+    """Whether planThreads picks the number of files from image sizes; only
+    then the streaming scan has to wait for a sample of headers."""
+    return threadBudget is not None and not jobsGiven
+
+
+def planThreads(headers):
+    """Split the --threads budget between files and per-op threads, from the
+    median size of the images about to be processed."""
+    global jobCount, opThreads
+
+    if threadBudget is None:
+        return
+
+    if jobsGiven:
+        opThreads = max(1, threadBudget // jobCount)
+    elif len(headers) == 0:
+        return
+    else:
+        megapixels = sorted(h["width"] * h["height"] / 1.0e6 for h in headers)
+        jobCount, opThreads = jobs.splitThreads(
+            threadBudget, megapixels[len(megapixels) // 2]
+        )
+
+    configureThreads()
+
+
+def startWorkers():
+    """Fork the pool workers of the run, after planThreads (they are made with
+    its split) but before crawl or prefetch threads run, see jobs.WorkerPool."""
+    global workerPool
+    if jobCount > 1 and workerPool is None:
+        workerPool = jobs.WorkerPool(jobCount, initWorker, (workerSettings(),))
 
-    for hdrFile in hdrFiles:
 
-        directory = Path(hdrFile).parent
-        filename = Path(hdrFile).stem
-        extension = Path(hdrFile).suffix
+def stopWorkers():
+    global workerPool
+    if workerPool is not None:
+        workerPool.close()
+        workerPool = None
 
-        IMG_CACHE = oiio.ImageCache.create(True)
 
-        frameBufferOrig = ImageBuf(str(hdrFile))
-        spec = frameBufferOrig.spec()
+def configureCache():
+    """Size the shared ImageCache; with a memory budget it gets at most half."""
+    memoryMB = cacheMemoryMB
+    if memoryBudgetMB > 0:
+        memoryMB = min(memoryMB, memoryBudgetMB / 2.0)
+    imagecache.configure(memoryMB, cacheOpenFiles, forceFloat=cacheForceFloat)
 
-        if blurredPrefix not in filename:
-            if Path(hdrBlurFolder, filename + blurredPrefix + hdrExtension).exists():
-                pass
+
+def showCacheStats():
+    tqdm.write(imagecache.summary())
+
+
+def runPhase(targetFunc, files, title, position, batch=1):
+    """Run a per-file pipeline over files and yield (file, result, error).
+
+    With a single job every step gets its own status bar, otherwise whole
+    pipelines are scheduled on the process pool, `batch` files per call.
+
+    files may also be an iterator that is still being produced; the pool then
+    only pulls new files while fewer than 2 * jobCount are in flight.
+    """
+
+    fileBar = tqdm(
+        total=len(files) if isinstance(files, list) else None,
+        desc="Complete",
+        ncols=width,
+        position=position,
+        unit="file",
+        ascii=True,
+        bar_format=barFormat,
+        disable=batchMode,
+    )
+
+    measuredFunc = report.Instrumented(targetFunc)
+
+    if jobCount <= 1:
+        step = runStep if batchMode else threadAndStatus
+
+        for file in files:
+
+            showUI(title, "Current File: " + Path(file).name)
+
+            try:
+                result, record = measuredFunc(file, step)
+            except Exception as e:
+                runReport.add(title, file, None, str(e))
+                yield file, None, str(e)
             else:
-                hdrFilesBlurring.append(hdrFile)
-        if (
-            spec.tile_width == spec.width
-            or spec.tile_width == 0
-            or frameBufferOrig.nmiplevels == 1
+                imagecache.collect(record["cache"])
+                runReport.add(title, file, record, None)
+                yield file, result, None
+
+            fileBar.update(1)
+
+    else:
+        showUI(title, "Processing on " + str(jobCount) + " workers")
+
+        for file, result, error in jobs.runJobs(
+            measuredFunc,
+            files,
+            jobCount,
+            initializer=initWorker,
+            initargs=(workerSettings(),),
+            batch=batch,
+            pool=workerPool,
         ):
-            hdrFilesTiling.append(hdrFile)
-        if filename not in hdrFilesPreviewNames:
-            hdrFilesPreview.append(hdrFile)
+            fileBar.update(1)
+            if error is None:
+                result, record = result
+                imagecache.collect(record["cache"])
+            else:
+                record = None
+            runReport.add(title, file, record, error)
+            yield file, result, error
 
-        IMG_CACHE.invalidate(str(hdrFile))
+    fileBar.close()
 
-    if (
-        len(hdrFilesBlurring) == 0
-        and len(hdrFilesTiling) == 0
-        and len(hdrFilesPreview) == 0
-    ):
 
-        showUI("", "Nothing to do...")
+def outputParams(kind):
+    """Current values of the settings an output kind depends on."""
+    params = dict(
+        (name, globals()[name])
+        for name in outputSettings[kind]
+        if name not in legacyDefaults or globals()[name] != legacyDefaults[name]
+    )
+    params.update(retiredSettings.get(kind, {}))
+    return params
 
-    if len(hdrFilesTiling) is not 0:
 
-        showUI(
-            "Searching for Files",
-            "Found "
-            + str(len(hdrFilesTiling))
-            + " files in scanline/No MipMap or not .exr format. We will make some :)",
+def recordOutput(buildManifest, index, kind, source, output):
+    """Store source fingerprint and settings of a freshly written output."""
+    fingerprint = None if kind == "tiling" else index.sourceFingerprint(source)
+    buildManifest.record(output, source, fingerprint, outputParams(kind))
+
+
+def outputPath(kind, source):
+    """Where the output of kind for source is written."""
+    directory = Path(source).parent
+    filename = Path(source).stem
+
+    if kind == "tiling":
+        return Path(directory, filename + tiledPrefix + hdrExtension)
+    if kind == "blurring":
+        return Path(hdrBlurFolder, filename + blurredPrefix + hdrExtension)
+    if kind == "preview":
+        return Path(hdrPrevFolder, filename + thumbnailExtension)
+    return Path(directory, filename + mipmapPrefix + mipmapExtension)
+
+
+def openJournal(root):
+    """Journal of this run; first discards what an interrupted run left behind."""
+    runJournal = journal.Journal(Path(root, journalFilename))
+
+    if not dryRun:
+        for path in runJournal.recover():
+            tqdm.write(prefix + Fore.YELLOW + "Discarded unfinished " + str(path))
+
+    return runJournal
+
+
+def journaled(runJournal, files, tasks):
+    """Log the outputs of every file as started right before a phase gets it.
+
+    tasks maps files to their output kinds.
+    """
+    for file in files:
+        for kind in tasks[file]:
+            runJournal.started(kind, file, outputPath(kind, file))
+        yield file
+
+
+def checkpoint(index, buildManifest):
+    """Save what is done so far; the index keeps files the scan hasn't reached."""
+    index.save(prune=False)
+    buildManifest.save()
+
+
+def showPlan(plan):
+    """Print what would be rebuilt, why, and a rough time estimate."""
+    total = 0.0
+
+    for kind, file, reason, header in plan:
+        perFile, perMegapixel = buildCost[kind]
+        cost = perFile + perMegapixel * header["width"] * header["height"] / 1e6
+        total += cost
+
+        tqdm.write(
+            "%-9s %-48s %-18s ~%7.1fs" % (kind, Path(file).name, reason, cost)
         )
-        time.sleep(4)
-
-        for hdrFileTiling in tqdm(
-            hdrFilesTiling,
-            desc="Complete",
-            ncols=width,
-            position=2,
-            unit="file",
-            ascii=True,
-            bar_format=barFormat,
-        ):
 
-            directory = Path(hdrFileTiling).parent
-            filename = Path(hdrFileTiling).stem
-            extension = Path(hdrFileTiling).suffix
+    tqdm.write(
+        "%d outputs to build, estimated %.0fs with 1 job / %.0fs with %d jobs"
+        % (len(plan), total, total / jobCount, jobCount)
+    )
 
-            showUI(
-                "Make tiled / MipMapped .exr", "Current File: " + filename + extension
-            )
 
-            IMG_CACHE = oiio.ImageCache.create(True)
+# -------------------------------------------------------------------------------------
+# Main
+# -------------------------------------------------------------------------------------
 
-            frameBufferOrig2 = ImageBuf(str(hdrFileTiling))
-            spec2 = frameBufferOrig2.spec()
 
-            outPutFile = str(Path(directory, filename + tiledPrefix + hdrExtension))
+def processHDRs():
+    """Main entry point of the app."""
 
-            if spec2.width > hdrWidth:
+    # a dry run only reports, it leaves the folders, index and manifest alone
+    if not dryRun:
+        if not Path(hdrPrevFolder).exists():
+            Path(hdrPrevFolder).mkdir(parents=True)
+        if not Path(hdrBlurFolder).exists():
+            Path(hdrBlurFolder).mkdir(parents=True)
+
+    # recovery deletes leftovers of an interrupted run, so it goes first
+    runJournal = openJournal(hdrFolder)
+    if not dryRun:
+        for resizedFile in Path(hdrFolder).glob(Path(resizedPath("*")).name):
+            journal.discard(resizedFile)
+
+    # before the crawl threads, unless the split has to wait for the headers
+    if not dryRun and not splitNeedsHeaders():
+        startWorkers()
+
+    hdrFiles = folder.getFiles(
+        hdrFolder, [], hdrExts, all=False, exclude=[journal.partialPattern]
+    )
 
-                newHeight = calculateResizeHeight(spec2.width, spec2.height, hdrWidth)
-                resizedFramebuffer = threadAndStatus(
-                    resizeHDR,
-                    [frameBufferOrig2, hdrWidth, newHeight],
-                    "Resizing",
-                    1,
-                    True,
-                )
+    index = probe.MetadataIndex(Path(hdrFolder, indexFilename))
+    buildManifest = manifest.BuildManifest(Path(hdrFolder, manifestFilename))
+    plan = []
+    failed = 0
 
-                writeFramebuffer = threadAndStatus(
-                    writeEXR, [resizedFramebuffer, outPutFile], "Saving", 0, False
-                )
+    with report.Stage("Scanning", runReport.stages):
+        for hdrFile in hdrFiles:
 
-            else:
-                writeFramebuffer = threadAndStatus(
-                    writeEXR, [frameBufferOrig2, outPutFile], "Saving", 0, False
-                )
+            directory = Path(hdrFile).parent
+            filename = Path(hdrFile).stem
+            extension = Path(hdrFile).suffix
 
-            IMG_CACHE.invalidate(str(hdrFileTiling))
-
-            # if Path(hdrFileTiling).exists():
-            #     Path(hdrFileTiling).unlink()
-            #     Path(hdrFileTiling).with_suffix(hdrExtension)
-            #     Path(outPutFile).rename(hdrFileTiling)
-
-            if errorFlag == 0:
-                # If file exists, delete it
-                if Path(hdrFileTiling).exists():
-                    newFile = Path(hdrFileTiling).with_suffix(hdrExtension)
-                    Path(hdrFileTiling).unlink()
-                    Path(outPutFile).resolve().rename(newFile)
-
-                    if hdrFileTiling in hdrFilesPreview:
-                        hdrFilesPreview.remove(hdrFileTiling)
-                        hdrFilesPreview.append(newFile)
-                    if hdrFileTiling in hdrFilesBlurring:
-                        hdrFilesBlurring.remove(hdrFileTiling)
-                        hdrFilesBlurring.append(newFile)
-                    tqdm.write(
-                        prefix + Fore.GREEN + "Successfully replaced the original file."
-                    )
+            try:
+                header = index.header(hdrFile)
+            except (IOError, OSError) as e:
+                tqdm.write(prefix + Fore.RED + str(e))
+                failed += 1
+                continue
 
-                else:
-                    tqdm.write(
-                        prefix
-                        + Fore.RED
-                        + "Error: %s not found. Could not delete the File."
-                        % hdrFileTiling
-                    )
+            fingerprint = index.sourceFingerprint(hdrFile)
+            blurFile = Path(hdrBlurFolder, filename + blurredPrefix + hdrExtension)
+            previewFile = Path(hdrPrevFolder, filename + thumbnailExtension)
 
+            if probe.needsTiling(header):
+                tilingReason = "scanline/no MipMap"
             else:
-                tqdm.write(
-                    prefix
-                    + Fore.RED
-                    + "Something went wrong on conversion. File not deleted."
+                tilingReason = buildManifest.staleReason(
+                    hdrFile, hdrFile, None, outputParams("tiling")
                 )
+            if blurredPrefix in filename:
+                blurReason = None
+            else:
+                blurReason = buildManifest.staleReason(
+                    blurFile, hdrFile, fingerprint, outputParams("blurring")
+                )
+            previewReason = buildManifest.staleReason(
+                previewFile, hdrFile, fingerprint, outputParams("preview")
+            )
 
-        showUI("", Fore.GREEN + "All HDRs converted...")
+            # tiling rewrites the source, the outputs made from it follow in
+            # this run instead of showing up as "source changed" in the next
+            if tilingReason is not None:
+                previewReason = previewReason or "source retiled"
+                if blurredPrefix not in filename:
+                    blurReason = blurReason or "source retiled"
 
-    if len(hdrFilesBlurring) is not 0:
+            for kind, reason in zip(
+                hdrTasks, [tilingReason, blurReason, previewReason]
+            ):
+                if reason is not None:
+                    plan.append((kind, hdrFile, reason, header))
+
+    if not dryRun:
+        index.save()
+
+    hdrFilesTiling = [file for kind, file, r, h in plan if kind == "tiling"]
+    hdrFilesBlurring = [file for kind, file, r, h in plan if kind == "blurring"]
+    hdrFilesPreview = [file for kind, file, r, h in plan if kind == "preview"]
+
+    planThreads([header for k, f, r, header in plan])
+    if not dryRun:
+        startWorkers()
+
+    try:
+        if dryRun:
+            showPlan(plan)
+        elif len(plan) == 0:
+            showUI("", "Nothing to do...")
+        elif pipelineMode:
+            failed += processHDRPipeline(
+                hdrFiles,
+                hdrFilesTiling,
+                hdrFilesBlurring,
+                hdrFilesPreview,
+                buildManifest,
+                index,
+                runJournal,
+            )
+        else:
+            failed += processHDRPhases(
+                hdrFilesTiling,
+                hdrFilesBlurring,
+                hdrFilesPreview,
+                buildManifest,
+                index,
+                runJournal,
+            )
+    finally:
+        if not dryRun:
+            buildManifest.save()
+        runJournal.close()
+
+    if buildAtlas and not dryRun:
+        failed += updateAtlas(hdrFiles)
+
+    if not dryRun:
+        showCacheStats()
+
+    exitPrompt()
+
+    return failed
+
+
+def updateAtlas(hdrFiles):
+    """Pack the previews of hdrFiles into one atlas image for the lookdev browser.
+
+    Returns the number of failures (0 or 1).
+    """
+    previewFiles = [outputPath("preview", hdrFile) for hdrFile in hdrFiles]
+    previewFiles = [previewFile for previewFile in previewFiles if previewFile.exists()]
+    if len(previewFiles) == 0:
+        return 0
+
+    try:
+        with report.Stage("Atlas", runReport.stages):
+            pasted = atlas.update(
+                previewFiles,
+                Path(hdrFolder, atlasFilename),
+                Path(hdrFolder, atlasIndexFilename),
+            )
+    except (IOError, OSError) as e:
+        tqdm.write(prefix + Fore.RED + "Could not update the preview atlas. %s" % e)
+        return 1
+
+    tqdm.write(
+        prefix
+        + Fore.GREEN
+        + "Preview atlas: %d of %d previews updated." % (pasted, len(previewFiles))
+    )
+    return 0
+
+
+def processHDRPhases(
+    hdrFilesTiling, hdrFilesBlurring, hdrFilesPreview, buildManifest, index, runJournal
+):
+    """Tiling, blurring and previews as separate phases, each reading the file again.
+
+    Returns the number of failed files.
+    """
+    failed = 0
+
+    if len(hdrFilesTiling) is not 0:
 
         showUI(
-            __title__,
+            "Searching for Files",
             "Found "
-            + str(len(hdrFilesBlurring))
-            + " files with no blurred partners. We will make some :)",
+            + str(len(hdrFilesTiling))
+            + " files in scanline/No MipMap or not .exr format. We will make some :)",
         )
-        time.sleep(4)
-
-        for hdrFileBlurring in tqdm(
-            hdrFilesBlurring,
-            desc="Complete",
-            ncols=width,
-            position=3,
-            unit="file",
-            ascii=True,
-            bar_format=barFormat,
+        pause(4)
+
+        tasks = dict.fromkeys(hdrFilesTiling, ["tiling"])
+
+        for done, (hdrFileTiling, newFile, error) in enumerate(
+            runPhase(
+                tileHDRFile,
+                journaled(runJournal, hdrFilesTiling, tasks),
+                "Make tiled / MipMapped .exr",
+                2,
+            ),
+            1,
         ):
 
-            directory = Path(hdrFileBlurring).parent
-            filename = Path(hdrFileBlurring).stem
-            extension = Path(hdrFileBlurring).suffix
+            if done % checkpointEvery == 0:
+                checkpoint(index, buildManifest)
 
-            showUI("Blurring HDRs", "Current File: " + filename + extension)
+            if error is not None:
+                runJournal.failed("tiling", hdrFileTiling, hdrFileTiling, error)
+                tqdm.write(prefix + Fore.RED + error)
+                failed += 1
+                continue
 
-            IMG_CACHE = oiio.ImageCache.create(True)
+            recordOutput(buildManifest, index, "tiling", newFile, newFile)
+            runJournal.completed("tiling", hdrFileTiling, newFile)
 
-            frameBufferOrig2 = ImageBuf(str(hdrFileBlurring))
-            spec2 = frameBufferOrig2.spec()
+            if hdrFileTiling in hdrFilesPreview:
+                hdrFilesPreview.remove(hdrFileTiling)
+                hdrFilesPreview.append(newFile)
+            if hdrFileTiling in hdrFilesBlurring:
+                hdrFilesBlurring.remove(hdrFileTiling)
+                hdrFilesBlurring.append(newFile)
+            tqdm.write(prefix + Fore.GREEN + "Successfully replaced the original file.")
 
-            outPutFile = str(
-                Path(hdrBlurFolder, filename + blurredPrefix + hdrExtension)
-            )
+        showUI("", Fore.GREEN + "All HDRs converted...")
 
-            newHeight = calculateResizeHeight(spec2.width, spec2.height, hdrBlurWidth)
+    if len(hdrFilesBlurring) is not 0:
 
-            resizedFramebuffer = threadAndStatus(
-                resizeHDR,
-                [frameBufferOrig2, hdrBlurWidth, newHeight],
-                "Resizing",
-                2,
-                True,
-            )
-            blurredFramebuffer = threadAndStatus(
-                blurImage, [resizedFramebuffer], "Blurring", 1, True
-            )
-            writeFramebuffer = threadAndStatus(
-                writeEXR, [blurredFramebuffer, outPutFile], "Saving", 0, False
-            )
+        showUI(
+            __title__,
+            "Found "
+            + str(len(hdrFilesBlurring))
+            + " files with no blurred partners. We will make some :)",
+        )
+        pause(4)
+
+        tasks = dict.fromkeys(hdrFilesBlurring, ["blurring"])
+
+        for done, (hdrFileBlurring, outPutFile, error) in enumerate(
+            runPhase(
+                blurHDRFile,
+                journaled(runJournal, hdrFilesBlurring, tasks),
+                "Blurring HDRs",
+                3,
+            ),
+            1,
+        ):
 
-            IMG_CACHE.invalidate(str(hdrFileBlurring))
+            if done % checkpointEvery == 0:
+                checkpoint(index, buildManifest)
 
-            # hdrFilesPreview.append(outPutFile)
+            if error is not None:
+                runJournal.failed("blurring", hdrFileBlurring, hdrFileBlurring, error)
+                tqdm.write(prefix + Fore.RED + error)
+                failed += 1
+            else:
+                recordOutput(
+                    buildManifest, index, "blurring", hdrFileBlurring, outPutFile
+                )
+                runJournal.completed("blurring", hdrFileBlurring, outPutFile)
 
         showUI("", Fore.GREEN + "All HDRs blurred...")
 
@@ -650,130 +1487,301 @@ def processHDRs():
             + str(len(hdrFilesPreview))
             + " files with no Preview-JPGs. We will make some :)",
         )
-        time.sleep(4)
-
-        for hdrFilePreview in tqdm(
-            hdrFilesPreview,
-            desc="Complete",
-            ncols=width,
-            position=3,
-            unit="file",
-            ascii=True,
-            bar_format=barFormat,
+        pause(4)
+
+        tasks = dict.fromkeys(hdrFilesPreview, ["preview"])
+
+        for done, (hdrFilePreview, outPutFile, error) in enumerate(
+            runPhase(
+                previewHDRFile,
+                journaled(runJournal, hdrFilesPreview, tasks),
+                "Thumbnail creation",
+                3,
+                thumbnailBatch,
+            ),
+            1,
         ):
 
-            directory = Path(hdrFilePreview).parent
-            filename = Path(hdrFilePreview).stem
-            extension = Path(hdrFilePreview).suffix
+            if done % checkpointEvery == 0:
+                checkpoint(index, buildManifest)
 
-            showUI("Thumbnail creation", "Current File: " + filename + extension)
+            if error is not None:
+                runJournal.failed("preview", hdrFilePreview, hdrFilePreview, error)
+                tqdm.write(prefix + Fore.RED + error)
+                failed += 1
+            else:
+                recordOutput(
+                    buildManifest, index, "preview", hdrFilePreview, outPutFile
+                )
+                runJournal.completed("preview", hdrFilePreview, outPutFile)
 
-            IMG_CACHE = oiio.ImageCache.create(True)
+        showUI("", Fore.GREEN + "All previews generated...")
 
-            frameBufferOrig2 = ImageBuf(str(hdrFilePreview))
-            spec2 = frameBufferOrig2.spec()
+    return failed
 
-            outPutFile = str(Path(hdrPrevFolder, filename + thumbnailExtension))
 
-            sRGBBuffer = threadAndStatus(
-                convertColor, [frameBufferOrig2, "linear", "sRGB"], "Lin2sRGB", 2, True
-            )
+def processHDRPipeline(
+    hdrFiles,
+    hdrFilesTiling,
+    hdrFilesBlurring,
+    hdrFilesPreview,
+    buildManifest,
+    index,
+    runJournal,
+):
+    """One phase that decodes every HDR once and derives all missing outputs from it.
 
-            newHeight = calculateResizeHeight(spec2.width, spec2.height, thumbnailWidth)
+    Returns the number of failed files.
+    """
+    failed = 0
 
-            resizedFramebuffer = threadAndStatus(
-                resizeHDR, [sRGBBuffer, thumbnailWidth, newHeight], "Resizing", 1, True
-            )
-            writeFramebuffer = threadAndStatus(
-                writeJPG, [resizedFramebuffer, outPutFile], "Saving", 0, False
+    tasks = {}
+    for hdrFile in hdrFiles:
+        fileTasks = [
+            task
+            for task, files in zip(
+                hdrTasks, [hdrFilesTiling, hdrFilesBlurring, hdrFilesPreview]
             )
+            if hdrFile in files
+        ]
+        if len(fileTasks) != 0:
+            tasks[hdrFile] = fileTasks
+
+    if len(tasks) == 0:
+        return failed
+
+    showUI(
+        "Searching for Files",
+        "Found "
+        + str(len(tasks))
+        + " files with missing tiled, blurred or preview versions. We will make some :)",
+    )
+    pause(4)
+
+    for done, (hdrFile, outputs, error) in enumerate(
+        runPhase(
+            functools.partial(processHDRFile, tasks=tasks),
+            journaled(runJournal, [f for f in hdrFiles if f in tasks], tasks),
+            "Processing HDRs",
+            3,
+        ),
+        1,
+    ):
 
-            IMG_CACHE.invalidate(str(hdrFilePreview))
+        if done % checkpointEvery == 0:
+            checkpoint(index, buildManifest)
 
-        showUI("", Fore.GREEN + "All previews generated...")
+        if error is not None:
+            for kind in tasks[hdrFile]:
+                runJournal.failed(kind, hdrFile, hdrFile, error)
+            tqdm.write(prefix + Fore.RED + error)
+            failed += 1
+            continue
+
+        source = outputs.get("tiling", hdrFile)
+        for kind in hdrTasks:
+            if kind in outputs:
+                recordOutput(buildManifest, index, kind, source, outputs[kind])
+                runJournal.completed(kind, hdrFile, outputs[kind])
 
-    tqdm.write(prefix + "Press Enter to exit or close the Terminal")
-    wait_key()
+        if "tiling" in outputs:
+            tqdm.write(prefix + Fore.GREEN + "Successfully replaced the original file.")
 
+    showUI("", Fore.GREEN + "All HDRs processed...")
 
-def processTextures(excludeFolders):
-    allTextures = folder.getFiles(rootFolder, excludeFolders, textureExts, all=True)
-    selectedTextures = []
+    return failed
 
-    for texture in allTextures:
 
-        directory = Path(texture).parent
-        filename = Path(texture).stem
-        extension = Path(texture).suffix
+def processTextures(excludeFolders, include=None, exclude=None):
+    """Crawl, probe and convert as one streaming pipeline: conversion starts
+    with the first texture that needs it while the scan goes on.
 
-        IMG_CACHE = oiio.ImageCache.create(True)
+    Returns the number of failed files.
+    """
+    allTextures = folder.crawl(
+        rootFolder,
+        textureExts,
+        excludeFolders,
+        include,
+        (exclude or []) + [journal.partialPattern],
+        all=True,
+    )
 
-        frameBufferOrig = ImageBuf(str(texture))
-        spec = frameBufferOrig.spec()
+    index = probe.MetadataIndex(Path(rootFolder, indexFilename))
+    buildManifest = manifest.BuildManifest(Path(rootFolder, manifestFilename))
+    runJournal = openJournal(rootFolder)
+    plan = []
+    scanFailed = [0]
+    failed = 0
+    converted = 0
+
+    def probeTextures():
+        """(texture, header) of the textures that aren't tiled with MIP maps."""
+        for texture in allTextures:
+            try:
+                header = index.header(texture)
+            except (IOError, OSError) as e:
+                tqdm.write(prefix + Fore.RED + str(e))
+                scanFailed[0] += 1
+                continue
+
+            if probe.needsTiling(header):
+                yield texture, header
+
+    def selectTextures(found):
+        with report.Stage("Scanning", runReport.stages):
+            for texture, header in found:
+
+                mipmapFile = outputPath("mipmap", texture)
+                reason = buildManifest.staleReason(
+                    mipmapFile,
+                    texture,
+                    index.sourceFingerprint(texture),
+                    outputParams("mipmap"),
+                )
 
-        if (
-            spec.tile_width == spec.width
-            or spec.tile_width == 0
-            or frameBufferOrig.nmiplevels == 1
-        ):
-            if Path(directory, filename + mipmapPrefix + mipmapExtension).exists():
-                pass
-            else:
-                selectedTextures.append(texture)
+                if reason is not None:
+                    plan.append(("mipmap", texture, reason, header))
+                    if not dryRun:
+                        runJournal.started("mipmap", texture, mipmapFile)
+                    yield texture
 
-        IMG_CACHE.invalidate(str(texture))
+        if not dryRun:
+            index.save()
 
-    if len(selectedTextures) == 0:
+    if dryRun:
 
-        showUI("", "Nothing to do...")
+        for texture in selectTextures(probeTextures()):
+            pass
+        planThreads([header for k, f, r, header in plan])
+        showPlan(plan)
 
-    if len(selectedTextures) is not 0:
+    else:
 
         showUI(
             "Searching for Files",
-            "Found "
-            + str(len(selectedTextures))
-            + " files in scanline/No MipMap or not .exr format. We will make some :)",
+            "Converting files in scanline/No MipMap or not .exr format while searching :)",
         )
-        time.sleep(4)
-
-        for texture in tqdm(
-            selectedTextures,
-            desc="Complete",
-            ncols=width,
-            position=1,
-            unit="file",
-            ascii=True,
-            bar_format=barFormat,
-        ):
 
-            directory = Path(texture).parent
-            filename = Path(texture).stem
-            extension = Path(texture).suffix
+        try:
+            found = probeTextures()
+            sampled = []
+            if splitNeedsHeaders():
+                # the pool is sized once, from the first textures found; they
+                # are probed on this thread, so no thread of ours is in OIIO
+                # while the workers fork
+                sampled = list(itertools.islice(found, threadSample))
+            planThreads([header for texture, header in sampled])
+            startWorkers()
+
+            candidates = selectTextures(itertools.chain(sampled, found))
+            for texture, outPutFile, error in runPhase(
+                convertTextureFile,
+                jobs.prefetch(candidates, scanAhead),
+                "Make tiled / MipMapped .exr",
+                1,
+            ):
+
+                converted += 1
+                if converted % checkpointEvery == 0:
+                    checkpoint(index, buildManifest)
+
+                if error is not None:
+                    runJournal.failed(
+                        "mipmap", texture, outputPath("mipmap", texture), error
+                    )
+                    tqdm.write(prefix + Fore.RED + error)
+                    failed += 1
+                else:
+                    recordOutput(buildManifest, index, "mipmap", texture, outPutFile)
+                    runJournal.completed("mipmap", texture, outPutFile)
+        except BaseException:
+            index.save(prune=False)
+            raise
+        finally:
+            # on Ctrl-C too, so the next run only redoes the unfinished files
+            buildManifest.save()
+            runJournal.close()
+
+        if converted == 0:
+            showUI("", "Nothing to do...")
+        else:
+            showUI("", Fore.GREEN + "All textures converted...")
 
-            showUI(
-                "Make tiled / MipMapped .exr", "Current File: " + filename + extension
-            )
+        showCacheStats()
 
-            IMG_CACHE = oiio.ImageCache.create(True)
+    exitPrompt()
 
-            frameBufferOrig2 = ImageBuf(str(texture))
+    return failed + scanFailed[0]
 
-            outPutFile = str(Path(directory, filename + mipmapPrefix + mipmapExtension))
 
-            writeFramebuffer = threadAndStatus(
-                writeTexture, [frameBufferOrig2, outPutFile], "Saving", 0, False
+def compressionArg(value):
+    """exr codec[:level], or a codec only .tx know (lzw); .exr use zip then."""
+    codecs = exrCodecs + [codec for codec in tiffCodecs if codec not in exrCodecs]
+    if value.split(":")[0] not in codecs:
+        raise argparse.ArgumentTypeError(
+            "unknown compression %s, use one of %s" % (value, ", ".join(codecs))
+        )
+    return value
+
+
+def tileSizeArg(value):
+    """[env|blurred|texture=]auto|32|64|128|256 -> (kinds, size)"""
+    kinds, _, size = value.rpartition("=")
+    kinds = [kinds] if kinds else ["env", "blurred", "texture"]
+
+    if any(kind not in ["env", "blurred", "texture"] for kind in kinds):
+        raise argparse.ArgumentTypeError("unknown output %s" % kinds[0])
+    if size != "auto":
+        if not size.isdigit() or int(size) not in tileSizeChoices:
+            raise argparse.ArgumentTypeError(
+                "tile size has to be auto, 32, 64, 128 or 256"
             )
+        size = int(size)
+    return kinds, size
+
 
-            IMG_CACHE.invalidate(str(texture))
+def stageArg(value):
+    """[env|blurred|preview=]name[:arg] -> (kinds, name)
+
+    Without a kind the stage runs on the blurred and preview outputs; the env
+    texture is only changed on request.
+    """
+    kinds, _, name = value.partition("=")
+    if not name:
+        kinds, name = "", kinds
+    kinds = [kinds] if kinds else ["blurred", "preview"]
+
+    if any(kind not in ["env", "blurred", "preview"] for kind in kinds):
+        raise argparse.ArgumentTypeError("unknown output %s" % kinds[0])
+    if not stages.hasNumpy():
+        raise argparse.ArgumentTypeError("stages need numpy")
+    try:
+        stages.resolve(name)
+    except (ValueError, ImportError, AttributeError) as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return kinds, name
 
-        showUI("", Fore.GREEN + "All textures converted...")
 
-    tqdm.write(prefix + "Press Enter to exit or close the Terminal")
-    wait_key()
+def viewArg(value):
+    if value in color.views and value != "standard" and not color.hasNumpy():
+        raise argparse.ArgumentTypeError("view %s needs numpy" % value)
+    return value
+
+
+def splitList(value):
+    """Command line lists are separated with ;"""
+    return [item for item in (value or "").split(";") if item]
 
 
 def main():
+    """Returns the exit code: 0 on success, 1 if any file failed."""
+    global jobCount, pipelineMode, dryRun, blurEngine, batchMode, memoryBudgetMB
+    global threadBudget, jobsGiven
+    global cacheMemoryMB, cacheOpenFiles, cacheForceFloat, exrCompression, dataFormat
+    global envTileSize, blurTileSize, textureTileSize, mipReuse, buildAtlas
+    global previewView, previewExposure, colorLUT, envStages, blurStages, previewStages
+
     parser = argparse.ArgumentParser(
         add_help=True,
         version=__version__,
@@ -799,28 +1807,286 @@ def main():
         dest="folder",
         help="Excludes Folders from textures processing. Separated with ;",
     )
+    parser.add_argument(
+        "--include",
+        action="store",
+        dest="include",
+        help="Only processes textures matching these patterns. Separated with ;\n"
+        + "Glob on the name, or on the relative path if it contains a /\n"
+        + "(* stays within a folder, ** crosses folders), re:<expression>\n"
+        + 'for regular expressions, e.g. "*_diff.*;assets/**;re:_v[0-9]+\\."',
+    )
+    parser.add_argument(
+        "--ignore",
+        action="store",
+        dest="ignore",
+        help="Skips textures and folders matching these patterns (like --include)",
+    )
+    parser.add_argument(
+        "--jobs",
+        action="store",
+        dest="jobs",
+        type=int,
+        default=None,
+        help="Number of files processed in parallel worker processes.\n"
+        + "0 uses all cores (default: 1)",
+    )
+    parser.add_argument(
+        "--threads",
+        action="store",
+        dest="threads",
+        type=int,
+        help="Thread budget shared by parallel files and the threads of each\n"
+        + "image operation. Without --jobs the split follows the image sizes:\n"
+        + "many small textures -> more files, huge hdrs -> more threads per op.\n"
+        + "0 uses all cores",
+    )
+
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        dest="pipeline",
+        help="Decodes every hdr once and derives tiled, blurred\n"
+        + "and preview versions from that single read",
+    )
+
+    parser.add_argument(
+        "--atlas",
+        action="store_true",
+        dest="atlas",
+        help="Also packs all hdr previews into one image with a JSON index\n"
+        + "of their UV rects (%s / %s)" % (atlasFilename, atlasIndexFilename),
+    )
+
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        dest="dryRun",
+        help="Only reports which outputs would be (re)built, why,\n"
+        + "and an estimate of how long it would take",
+    )
+
+    parser.add_argument(
+        "--blur-engine",
+        action="store",
+        dest="blurEngine",
+        choices=blur.engines,
+        default=blurEngine,
+        help="Blur implementation for the blurred hdrs (default: %(default)s)\n"
+        + "separable: two 1D passes, fft: frequency space (needs numpy),\n"
+        + "pyramid: downsample-blur-upsample approximation, auto: pick by kernel size",
+    )
+
+    parser.add_argument(
+        "--no-mip-reuse",
+        action="store_false",
+        dest="mipReuse",
+        help="Resizes blurred hdrs and previews from the full resolution image\n"
+        + "instead of a MIP level of the tiled .exr",
+    )
+
+    parser.add_argument(
+        "--view",
+        action="store",
+        dest="view",
+        type=viewArg,
+        choices=color.views,
+        default=previewView,
+        help="View transform of the previews (default: %(default)s)\n"
+        + "reinhard/filmic/aces roll off highlights instead of clipping (need numpy)",
+    )
+
+    parser.add_argument(
+        "--exposure",
+        action="store",
+        dest="exposure",
+        type=float,
+        default=previewExposure,
+        help="Exposure of the previews in stops (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--color-lut",
+        action="store_true",
+        dest="colorLUT",
+        help="Bakes the preview color transform into a 1D LUT applied with numpy",
+    )
+
+    parser.add_argument(
+        "--stage",
+        action="append",
+        dest="stages",
+        type=stageArg,
+        default=[],
+        help="Custom numpy stage for an output, in the given order, e.g.\n"
+        + "--stage blurred=sunclamp:32 --stage preview=lumastats. Without\n"
+        + "env=, blurred= or preview= it runs on blurred and preview. Built in:\n"
+        + "%s, or module.function of your own (needs numpy)"
+        % ", ".join(sorted(stages.registry)),
+    )
+
+    parser.add_argument(
+        "--batch",
+        "--no-ui",
+        action="store_true",
+        dest="batch",
+        help="Headless mode for pipelines: no banner, no pauses, no key prompt,\n"
+        + "exit code 1 if any file failed",
+    )
+
+    parser.add_argument(
+        "--memory-budget",
+        action="store",
+        dest="memoryBudget",
+        type=int,
+        default=memoryBudgetMB,
+        help="Memory per file in MB. Larger hdrs are resized in strips\n"
+        + "straight from disk instead of being loaded (default: 0, unlimited)",
+    )
+
+    parser.add_argument(
+        "--cache-memory",
+        action="store",
+        dest="cacheMemory",
+        type=int,
+        default=cacheMemoryMB,
+        help="Size of the shared ImageCache in MB (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--cache-files",
+        action="store",
+        dest="cacheFiles",
+        type=int,
+        default=cacheOpenFiles,
+        help="Files the ImageCache keeps open at once (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--force-float",
+        action="store_true",
+        dest="forceFloat",
+        help="Cache pixels as float instead of the file data format",
+    )
+
+    parser.add_argument(
+        "--compression",
+        action="store",
+        dest="compression",
+        type=compressionArg,
+        default=exrCompression,
+        help="Compression of written .exr, optionally with level, e.g. piz,\n"
+        + "dwaa:45 (default: %(default)s). .tx textures use zip unless none/lzw,\n"
+        + ".exr use zip for lzw",
+    )
+
+    parser.add_argument(
+        "--data-format",
+        action="store",
+        dest="dataFormat",
+        choices=dataFormats,
+        default=dataFormat,
+        help="Data format of written .exr/.tx (default: %(default)s)\n"
+        + "auto: 8/16 bit sources stay integer, float becomes half\n"
+        + "unless it has values above the half range",
+    )
+
+    parser.add_argument(
+        "--tile-size",
+        action="append",
+        dest="tileSizes",
+        type=tileSizeArg,
+        default=[],
+        help="Tile size of written .exr/.tx: auto (default) or 32/64/128/256,\n"
+        + "for all outputs or one of them, e.g. --tile-size env=256\n"
+        + "--tile-size blurred=128 --tile-size texture=64",
+    )
+
+    parser.add_argument(
+        "--report",
+        action="store",
+        dest="report",
+        help="Writes wall/CPU time, peak memory, pixels and bytes per stage\n"
+        + "and file to this file, as CSV if it ends in .csv, else JSON",
+    )
 
     results = parser.parse_args()
 
-    if results.adaptHDR:
-        processHDRs()
-    elif results.textures:
-        excludeFolders = results.folder.split(";")
-        processTextures(excludeFolders)
-    else:
-        print(parser.parse_args(["-h"]))
+    jobsGiven = results.jobs is not None
+    if jobsGiven:
+        jobCount = results.jobs if results.jobs > 0 else jobs.cpuCount()
+    if results.threads is not None:
+        threadBudget = results.threads if results.threads > 0 else jobs.cpuCount()
+    pipelineMode = results.pipeline
+    buildAtlas = results.atlas
+    dryRun = results.dryRun
+    blurEngine = results.blurEngine
+    mipReuse = results.mipReuse
+    previewView = results.view
+    previewExposure = results.exposure
+    colorLUT = results.colorLUT
+    batchMode = results.batch
+    memoryBudgetMB = results.memoryBudget
+    cacheMemoryMB = results.cacheMemory
+    cacheOpenFiles = results.cacheFiles
+    cacheForceFloat = results.forceFloat
+    exrCompression = results.compression
+    dataFormat = results.dataFormat
+
+    for kinds, name in results.stages:
+        if "env" in kinds:
+            envStages = envStages + [name]
+        if "blurred" in kinds:
+            blurStages = blurStages + [name]
+        if "preview" in kinds:
+            previewStages = previewStages + [name]
+
+    for kinds, size in results.tileSizes:
+        if "env" in kinds:
+            envTileSize = size
+        if "blurred" in kinds:
+            blurTileSize = size
+        if "texture" in kinds:
+            textureTileSize = size
+
+    configureCache()
+
+    try:
+        if results.adaptHDR:
+            failed = processHDRs()
+        elif results.textures:
+            failed = processTextures(
+                splitList(results.folder),
+                splitList(results.include),
+                splitList(results.ignore),
+            )
+        else:
+            print(parser.parse_args(["-h"]))
+    finally:
+        stopWorkers()
+
+    if results.report:
+        settings = workerSettings()
+        settings.update(
+            jobCount=jobCount, threadBudget=threadBudget, pipelineMode=pipelineMode
+        )
+        runReport.save(results.report, __version__, settings)
+
+    return 1 if failed else 0
 
 
 if __name__ == "__main__":
     """This is executed when run from the command line."""
+    multiprocessing.freeze_support()
     try:
         sizex, sizey = get_terminal_size()
         width = sizex
 
-        main()
-    except (KeyboardInterrupt, KeyError) as e:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        # interrupted, not successful: the journal lets the next run resume
         print("\n")
         try:
-            sys.exit(0)
+            sys.exit(130)
         except SystemExit:
-            os._exit(0)
+            os._exit(130)
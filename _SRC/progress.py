@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Progress events from pipeline steps to the status bar
+
+by David Maus - www.david-maus.de
+
+Written by David Maus / info@david-maus.de, 2018
+"""
+# fmt: off
+
+# -------------------------------------------------------------------------------------
+# Imports
+# -------------------------------------------------------------------------------------
+
+import sys; sys.dont_write_bytecode = True
+import threading
+from OpenImageIO import ROI
+
+# -------------------------------------------------------------------------------------
+# Global vars
+# -------------------------------------------------------------------------------------
+
+stripRows           = 64
+
+local               = threading.local()
+
+# -------------------------------------------------------------------------------------
+# Functions
+# -------------------------------------------------------------------------------------
+# fmt: on
+
+
+def listen(events):
+    """Send progress of the calling thread to the queue `events`."""
+    local.events = events
+
+
+def count(counter):
+    """Also hand the events of the calling thread to counter.add(kind, value),
+    returns the previous counter so nested stages can restore it."""
+    previous = getattr(local, "counter", None)
+    local.counter = counter
+    return previous
+
+
+def _put(kind, value):
+    events = getattr(local, "events", None)
+    if events is not None:
+        events.put((kind, value))
+    counter = getattr(local, "counter", None)
+    if counter is not None:
+        counter.add(kind, value)
+
+
+def total(pixels):
+    """Announce how many pixels the current step will process."""
+    _put("total", pixels)
+
+
+def advance(pixels):
+    """Report pixels processed since the last call."""
+    _put("progress", pixels)
+
+
+def written(nbytes):
+    """Report bytes written to disk by the current step."""
+    _put("bytes", nbytes)
+
+
+def done(result):
+    """Hand the TaskResult of the finished step to the status bar."""
+    _put("done", result)
+
+
+def strips(spec, rows=None):
+    """ROIs of `rows` scanlines covering the data window of spec, so a step
+    can process an image in reportable pieces."""
+    rows = rows or stripRows
+    for ybegin in range(spec.y, spec.y + spec.height, rows):
+        yield ROI(
+            spec.x,
+            spec.x + spec.width,
+            ybegin,
+            min(spec.y + spec.height, ybegin + rows),
+            spec.z,
+            spec.z + spec.depth,
+            0,
+            spec.nchannels,
+        )
@@ -7,7 +7,7 @@ Python FIGlet adaption
 
 from __future__ import print_function, unicode_literals
 import os
-import pkg_resources
+import marshal
 import re
 import sys
 from optparse import OptionParser
@@ -83,23 +83,42 @@ class FigletFont(object):
     reMagicNumber = re.compile(r"^[tf]lf2.")
     reEndMarker = re.compile(r"(.)\s*$")
 
+    # parsed glyph tables, shared by all instances of a font
+    compiledFonts = {}
+    compiledAttributes = (
+        "comment",
+        "chars",
+        "width",
+        "height",
+        "hardBlank",
+        "printDirection",
+        "smushMode",
+    )
+    compiledExtension = ".flm"
+
     def __init__(self, font=DEFAULT_FONT):
         self.font = font
 
         self.comment = ""
         self.chars = {}
         self.width = {}
-        self.data = self.preloadFont(font)
-        self.loadFont()
+        if not self.loadCompiledFont():
+            self.data = self.preloadFont(font)
+            self.loadFont()
+            self.saveCompiledFont()
+
+    @classmethod
+    def fontPath(cls, font, extension=".flf"):
+        return os.path.join(
+            os.path.dirname(os.path.realpath(__file__)), "fonts", font + extension
+        )
 
     @classmethod
     def preloadFont(cls, font):
         """
         Load font data if exist
         """
-        data = os.path.join(
-            os.path.dirname(os.path.realpath(__file__)), "fonts", font + ".flf"
-        )
+        data = cls.fontPath(font)
         with open(data, "r") as myfile:
             data = myfile.read()
 
@@ -110,16 +129,16 @@ class FigletFont(object):
     def isValidFont(cls, font):
         if not font.endswith((".flf", ".tlf")):
             return False
-        f = os.path.join(os.getcwd(), "3-d.flf")
-        header = f.readline().decode("UTF-8", "replace")
-        f.close()
+        with open(os.path.join(os.path.dirname(cls.fontPath(font)), font), "rb") as f:
+            header = f.readline().decode("UTF-8", "replace")
         return cls.reMagicNumber.search(header)
 
     @classmethod
     def getFonts(cls):
+        # plain listdir instead of pkg_resources, which is slow to import
         return [
             font.rsplit(".", 2)[0]
-            for font in pkg_resources.resource_listdir("pyfiglet", "fonts")
+            for font in os.listdir(os.path.dirname(cls.fontPath(DEFAULT_FONT)))
             if cls.isValidFont(font)
         ]
 
@@ -244,6 +263,46 @@ class FigletFont(object):
         except Exception as e:
             raise FontError("problem parsing %s font: %s" % (self.font, e))
 
+    def loadCompiledFont(self):
+        """
+        Take the parsed glyph tables from memory or from the marshal cache
+        next to the font file, skipping the parsing in loadFont
+        """
+        compiled = self.compiledFonts.get(self.font)
+
+        if compiled is None:
+            try:
+                cachePath = self.fontPath(self.font, self.compiledExtension)
+                if os.path.getmtime(cachePath) < os.path.getmtime(
+                    self.fontPath(self.font)
+                ):
+                    return False
+                with open(cachePath, "rb") as cacheFile:
+                    compiled = marshal.load(cacheFile)
+            except (IOError, OSError, EOFError, ValueError, TypeError):
+                return False
+            if compiled.get("python") != list(sys.version_info[:2]):
+                return False
+            self.compiledFonts[self.font] = compiled
+
+        for name in self.compiledAttributes:
+            setattr(self, name, compiled[name])
+        return True
+
+    def saveCompiledFont(self):
+        compiled = dict(
+            (name, getattr(self, name)) for name in self.compiledAttributes
+        )
+        compiled["python"] = list(sys.version_info[:2])
+        self.compiledFonts[self.font] = compiled
+
+        try:
+            cachePath = self.fontPath(self.font, self.compiledExtension)
+            with open(cachePath, "wb") as cacheFile:
+                marshal.dump(compiled, cacheFile)
+        except (IOError, OSError):
+            pass
+
     def __str__(self):
         return "<FigletFont object: %s>" % self.font
 
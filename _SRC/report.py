@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Per-stage timing and memory instrumentation and the run report
+
+by David Maus - www.david-maus.de
+
+Written by David Maus / info@david-maus.de, 2018
+"""
+# fmt: off
+
+# -------------------------------------------------------------------------------------
+# Imports
+# -------------------------------------------------------------------------------------
+
+import sys; sys.dont_write_bytecode = True
+import os
+import csv
+import json
+import time
+import progress
+import imagecache
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Windows, no peak RSS
+
+# -------------------------------------------------------------------------------------
+# Global vars
+# -------------------------------------------------------------------------------------
+
+reportVersion       = 2
+csvColumns          = ["phase", "file", "stage", "wall", "cpu", "peakRSSMB", "pixels", "bytes", "error"]
+
+# stages of the file currently processed by this process
+stages              = []
+# values its stages noted down, like luminance statistics
+notes               = {}
+
+# -------------------------------------------------------------------------------------
+# Functions
+# -------------------------------------------------------------------------------------
+# fmt: on
+
+
+def cpuTime():
+    times = os.times()
+    return times[0] + times[1]
+
+
+def resetPeakRSS():
+    """Start a new peak for peakRSSMB; only Linux can, elsewhere the peak
+    stays the one of the whole process."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except (IOError, OSError):
+        pass
+
+
+def peakRSSMB():
+    """Peak resident memory since resetPeakRSS (Linux VmHWM), or of the whole
+    process so far (ru_maxrss); None where unknown. The peak is per process,
+    so stages running at the same time on other threads share it."""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.0
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024.0 * 1024.0 if sys.platform == "darwin" else 1024.0)
+
+
+def note(kind, values):
+    """Add values of an output kind to the record of the file currently
+    processed; kinds are kept apart, so outputs can't overwrite each other."""
+    notes.setdefault(kind, {}).update(values)
+
+
+class Stage(object):
+    """Context manager that measures a block and appends the record to records.
+
+    Pixels and bytes are taken from the progress events the block sends.
+    """
+
+    def __init__(self, name, records=stages):
+        self.name = name
+        self.records = records
+        self.pixels = 0
+        self.bytes = 0
+
+    def add(self, kind, value):
+        if kind == "progress":
+            self.pixels += value
+        elif kind == "bytes":
+            self.bytes = value
+
+    def __enter__(self):
+        self.previous = progress.count(self)
+        self.wall = time.time()
+        self.cpu = cpuTime()
+        resetPeakRSS()
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        progress.count(self.previous)
+        self.record = {
+            "stage": self.name,
+            "wall": time.time() - self.wall,
+            "cpu": cpuTime() - self.cpu,
+            "peakRSSMB": peakRSSMB(),
+            "pixels": self.pixels,
+            "bytes": self.bytes,
+        }
+        if self.records is not None:
+            self.records.append(self.record)
+        return False
+
+
+class Instrumented(object):
+    """Wraps a per-file function so it returns (result, file record).
+
+    The record holds the stages of the file, its totals, the notes of its
+    stages per output kind and the ImageCache stats delta. Picklable as long
+    as func is, so records of pool workers make it back to the parent process.
+    """
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, *args, **kwargs):
+        del stages[:]
+        notes.clear()
+        cacheBefore = imagecache.stats()
+        wall = time.time()
+        cpu = cpuTime()
+        resetPeakRSS()
+
+        result = self.func(*args, **kwargs)
+
+        # every stage starts a new peak, the file peak is the largest of them
+        peaks = [peakRSSMB()] + [stage["peakRSSMB"] for stage in stages]
+        peaks = [peak for peak in peaks if peak is not None]
+        record = {
+            "wall": time.time() - wall,
+            "cpu": cpuTime() - cpu,
+            "peakRSSMB": max(peaks) if len(peaks) != 0 else None,
+            "pixels": sum(stage["pixels"] for stage in stages),
+            "bytes": sum(stage["bytes"] for stage in stages),
+            "stages": list(stages),
+            "notes": dict(notes),
+            "cache": imagecache.delta(cacheBefore, imagecache.stats()),
+        }
+        return result, record
+
+
+class RunReport(object):
+    """Collects file records and run level stages (like the scan) of a run and
+    writes them as JSON or CSV, with totals per stage."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.files = []
+        self.stages = []
+
+    def add(self, phase, file, record, error):
+        record = dict(record or {"stages": []})
+        record.update({"phase": phase, "file": str(file), "error": error})
+        self.files.append(record)
+
+    def totals(self):
+        totals = {}
+        for stage in self.stages + [s for r in self.files for s in r["stages"]]:
+            total = totals.setdefault(
+                stage["stage"],
+                {
+                    "count": 0,
+                    "wall": 0.0,
+                    "cpu": 0.0,
+                    "peakRSSMB": None,
+                    "pixels": 0,
+                    "bytes": 0,
+                },
+            )
+            total["count"] += 1
+            for key in ["wall", "cpu", "pixels", "bytes"]:
+                total[key] += stage[key]
+            if stage["peakRSSMB"] is not None:
+                total["peakRSSMB"] = max(total["peakRSSMB"] or 0, stage["peakRSSMB"])
+        return totals
+
+    def save(self, reportFile, version, settings):
+        """JSON unless reportFile ends in .csv."""
+        if str(reportFile).lower().endswith(".csv"):
+            self.saveCSV(reportFile)
+        else:
+            self.saveJSON(reportFile, version, settings)
+
+    def saveJSON(self, reportFile, version, settings):
+        with open(str(reportFile), "w") as f:
+            json.dump(
+                {
+                    "version": reportVersion,
+                    "tool": version,
+                    "started": self.started,
+                    "wall": time.time() - self.started,
+                    "settings": settings,
+                    "stages": self.stages,
+                    "files": self.files,
+                    "totals": self.totals(),
+                    "cache": imagecache.totals,
+                    "failed": len([r for r in self.files if r["error"] is not None]),
+                },
+                f,
+                indent=1,
+                sort_keys=True,
+            )
+
+    def saveCSV(self, reportFile):
+        """One row per stage and file, then the "(run)" totals per stage name
+        (which include the run level stages)."""
+        with open(str(reportFile), "wb" if sys.version_info[0] < 3 else "w") as f:
+            writer = csv.DictWriter(f, csvColumns, extrasaction="ignore")
+            writer.writeheader()
+
+            for record in self.files:
+                if len(record["stages"]) == 0:
+                    writer.writerow(
+                        {
+                            "phase": record["phase"],
+                            "file": record["file"],
+                            "error": record["error"],
+                        }
+                    )
+                for stage in record["stages"]:
+                    writer.writerow(
+                        dict(
+                            stage,
+                            phase=record["phase"],
+                            file=record["file"],
+                            error=record["error"] or "",
+                        )
+                    )
+            for name, total in sorted(self.totals().items()):
+                writer.writerow(
+                    dict(total, phase="", file="(run)", stage=name, error="")
+                )
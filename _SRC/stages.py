@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Custom pipeline stages on numpy arrays
+
+by David Maus - www.david-maus.de
+
+Written by David Maus / info@david-maus.de, 2018
+"""
+# fmt: off
+
+# -------------------------------------------------------------------------------------
+# Imports
+# -------------------------------------------------------------------------------------
+
+import sys; sys.dont_write_bytecode = True
+import importlib
+import OpenImageIO as oiio
+from OpenImageIO import ImageBuf, ROI
+import progress
+
+# -------------------------------------------------------------------------------------
+# Global vars
+# -------------------------------------------------------------------------------------
+
+sunClampMax         = 64.0
+lumaWeights         = [0.2126, 0.7152, 0.0722]
+lumaPercentiles     = [50, 99]
+
+np                  = None
+
+# name -> func(pixels, info, arg), see run()
+registry            = {}
+
+# -------------------------------------------------------------------------------------
+# Functions
+# -------------------------------------------------------------------------------------
+# fmt: on
+
+
+def hasNumpy():
+    """Import numpy on first use, it is slow to import and only stages need it."""
+    global np
+    if np is None:
+        try:
+            import numpy as np
+        except ImportError:
+            return False
+    return True
+
+
+def readPixels(srcBuffer):
+    """(rows, columns, channels) float32 array of srcBuffer; reshaping the
+    array get_pixels returns is a view, not another copy."""
+    spec = srcBuffer.spec()
+    pixels = np.asarray(srcBuffer.get_pixels(oiio.FLOAT), dtype=np.float32)
+    return pixels.reshape(spec.height, spec.width, spec.nchannels)
+
+
+def writePixels(spec, pixels):
+    """ImageBuf of spec (and its data format) holding pixels."""
+    Dst = ImageBuf(spec)
+    Dst.set_pixels(ROI.All, np.ascontiguousarray(pixels, dtype=np.float32))
+    return Dst
+
+
+def rgb(pixels):
+    return pixels[:, :, :3] if pixels.shape[2] >= 3 else pixels[:, :, :1]
+
+
+def register(name, func):
+    """Make func available as stage name. func gets the float32 pixel array,
+    the info dict of the run and the argument after the : in the stage name;
+    it changes pixels in place and returns None, or returns a new array."""
+    registry[name] = func
+
+
+def resolve(name):
+    """Stage function of "name[:arg]"; names that aren't registered are
+    imported as module.function. Returns (func, arg)."""
+    name, _, arg = name.partition(":")
+    if name in registry:
+        return registry[name], arg or None
+
+    moduleName, _, funcName = name.rpartition(".")
+    if not moduleName:
+        raise ValueError(
+            "unknown stage %s, use one of %s or module.function"
+            % (name, ", ".join(sorted(registry)))
+        )
+    return getattr(importlib.import_module(moduleName), funcName), arg or None
+
+
+def run(srcBuffer, names):
+    """Run the stages in names on srcBuffer, one after another.
+
+    The pixels are fetched as float32 once, every stage works on that array
+    (in place where it can) and a single ImageBuf in the data format of
+    srcBuffer is built at the end. Returns it with the info dict the stages
+    filled in.
+    """
+    if not hasNumpy():
+        raise ImportError("Pipeline stages need numpy")
+
+    spec = srcBuffer.spec()
+    progress.total(spec.width * spec.height * len(names))
+
+    pixels = readPixels(srcBuffer)
+    info = {}
+
+    for name in names:
+        func, arg = resolve(name)
+        result = func(pixels, info, arg)
+        if result is not None:
+            pixels = result
+        progress.advance(spec.width * spec.height)
+
+    return writePixels(spec, pixels), info
+
+
+def sunClamp(pixels, info, arg=None):
+    """Scale pixels whose brightest channel is above the limit down to it,
+    keeping their hue, so the sun doesn't smear across blurred versions."""
+    limit = float(arg or sunClampMax)
+    channels = rgb(pixels)
+    peak = channels.max(axis=2)[:, :, None]
+
+    info["sunClamped"] = int((peak > limit).sum())
+    channels *= limit / np.maximum(peak, limit)
+
+
+def luminanceStats(pixels, info, arg=None):
+    """Min, max, mean and percentiles of the Rec709 luminance."""
+    channels = rgb(pixels)
+    if channels.shape[2] == 3:
+        luminance = np.dot(channels, np.asarray(lumaWeights, dtype=np.float32))
+    else:
+        luminance = channels[:, :, 0]
+
+    info.update(
+        luminanceMin=float(luminance.min()),
+        luminanceMax=float(luminance.max()),
+        luminanceMean=float(luminance.mean()),
+    )
+    for percentile in lumaPercentiles:
+        info["luminanceP%d" % percentile] = float(np.percentile(luminance, percentile))
+
+
+register("sunclamp", sunClamp)
+register("lumastats", luminanceStats)
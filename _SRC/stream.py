@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Streaming resize for images larger than RAM
+
+by David Maus - www.david-maus.de
+
+Written by David Maus / info@david-maus.de, 2018
+"""
+# fmt: off
+
+# -------------------------------------------------------------------------------------
+# Imports
+# -------------------------------------------------------------------------------------
+
+import sys; sys.dont_write_bytecode = True
+import OpenImageIO as oiio
+from OpenImageIO import ImageBuf, ImageSpec, ImageBufAlgo, ImageOutput, ROI
+import progress
+import imagecache
+import journal
+
+# -------------------------------------------------------------------------------------
+# Functions
+# -------------------------------------------------------------------------------------
+# fmt: on
+
+
+def floatBytes(spec):
+    """Memory a spec needs as float pixels."""
+    return spec.width * spec.height * spec.nchannels * 4
+
+
+def exceedsBudget(spec, memoryBudgetMB):
+    """True if loading and resizing spec in memory would not fit the budget."""
+    return memoryBudgetMB > 0 and floatBytes(spec) > memoryBudgetMB * 1024 * 1024 / 2
+
+
+def resizeToFile(srcFile, outFile, width, height, filterName, memoryBudgetMB):
+    """Resize srcFile into a scanline outFile strip by strip.
+
+    The source is only read through the shared ImageCache, which the caller
+    limits to half the budget (see imagecache.configure); the other half is
+    used for the output strips. Peak memory stays around memoryBudgetMB
+    whatever the input resolution is.
+    """
+    budgetBytes = memoryBudgetMB * 1024 * 1024
+
+    srcBuffer = imagecache.openImage(srcFile)
+    srcSpec = srcBuffer.spec()
+
+    outSpec = ImageSpec(width, height, srcSpec.nchannels, srcSpec.format)
+    outSpec.channelnames = srcSpec.channelnames
+
+    out = ImageOutput.create(str(outFile))
+    if out is None or not out.open(str(outFile), outSpec):
+        raise IOError("Could not open %s: %s" % (outFile, oiio.geterror()))
+
+    # strip buffer + the pixel copy handed to the writer, both float
+    rows = max(1, int(budgetBytes / 4 / (width * srcSpec.nchannels * 4)))
+    progress.total(width * height)
+
+    finished = False
+    try:
+        for ybegin in range(0, height, rows):
+            yend = min(height, ybegin + rows)
+
+            stripSpec = ImageSpec(width, yend - ybegin, srcSpec.nchannels, oiio.FLOAT)
+            stripSpec.y = ybegin
+            stripSpec.full_width = width
+            stripSpec.full_height = height
+            strip = ImageBuf(stripSpec)
+
+            ImageBufAlgo.resize(
+                strip,
+                srcBuffer,
+                filtername=filterName,
+                roi=ROI(0, width, ybegin, yend, 0, 1, 0, srcSpec.nchannels),
+            )
+            if not out.write_scanlines(ybegin, yend, 0, strip.get_pixels(oiio.FLOAT)):
+                raise IOError("Could not write %s: %s" % (outFile, out.geterror()))
+
+            progress.advance(width * (yend - ybegin))
+        finished = True
+    finally:
+        out.close()
+        imagecache.release(srcFile)
+        # no truncated temporary file is left behind
+        if not finished:
+            journal.discard(outFile)
+
+    return str(outFile)
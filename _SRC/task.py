@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Per-task results of pipeline stages
+
+by David Maus - www.david-maus.de
+
+Written by David Maus / info@david-maus.de, 2018
+"""
+# fmt: off
+
+# -------------------------------------------------------------------------------------
+# Imports
+# -------------------------------------------------------------------------------------
+
+import sys; sys.dont_write_bytecode = True
+import traceback
+import report
+
+# -------------------------------------------------------------------------------------
+# Functions
+# -------------------------------------------------------------------------------------
+# fmt: on
+
+
+class TaskResult(object):
+    """Outcome of one stage for one file: its value (usually an ImageBuf or the
+    written file), the exception if it failed and its stage record (timing,
+    memory, pixels, bytes).
+
+    Every stage call gets its own result, so a failing stage can only ever
+    fail the file it belongs to.
+    """
+
+    def __init__(self, name, value=None, error=None, stage=None, trace=None):
+        self.name = name
+        self.value = value
+        self.error = error
+        self.stage = stage
+        self.trace = trace
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def wall(self):
+        return self.stage["wall"] if self.stage is not None else None
+
+    def get(self):
+        """The value, or raise the error of the stage."""
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+def run(name, func, args):
+    """Run func(*args) as a measured stage and wrap the outcome in a TaskResult."""
+    stage = report.Stage(name)
+    try:
+        with stage:
+            value = func(*args)
+    except Exception as e:
+        return TaskResult(
+            name, error=e, stage=stage.record, trace=traceback.format_exc()
+        )
+    return TaskResult(name, value, stage=stage.record)